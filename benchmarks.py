@@ -0,0 +1,263 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- benchmarks.py : It's a python script with synthetic data generators and performance benchmarks      -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Required local scripts
+import functions as fn
+import visualizations as vz
+from data import OrderBook
+
+# ================================ Synthetic data generators ============================================== #
+
+### Function definition for synthetic orderbooks
+def synthetic_orderbooks(n_snapshots:int=3600,
+                         depth:int=25,
+                         interval:str='1s',
+                         start:str='2021-07-05 13:00',
+                         seed:int=0,
+                         columnar:bool=False):
+
+    """
+    Synthetic orderbook generator with the structure of ob_data. The mid-price follows a random walk on a 0.1 USD
+    tick (most of the orderbooks don't move it, like in real data) and the levels are spaced from the best bid
+    and ask with random volumes
+
+    Parameters
+    ----------
+
+    n_snapshots: int (default:3600) --> Optional parameter
+        Number of orderbooks
+
+    depth: int (default:25) --> Optional parameter
+        Number of levels of each orderbook
+
+    interval: str (default:'1s') --> Optional parameter
+        Time between orderbooks, as a pandas time offset
+
+    start: str (default:'2021-07-05 13:00') --> Optional parameter
+        Timestamp of the first orderbook (UTC)
+
+    seed: int (default:0) --> Optional parameter
+        Seed of the random generator
+
+    columnar: bool (default:False) --> Optional parameter
+        Return an OrderBook instead of a dict of data frames
+
+    Returns
+    -------
+
+    ob_data: dict or OrderBook
+        Dict of data frames (timestamp --> orderbook with bid_size, bid, ask and ask_size columns) or the same data
+        in a columnar OrderBook
+    """
+
+    rng = np.random.default_rng(seed)
+
+    # -- Mid-price random walk and orderbook timestamps -- #
+    moves = rng.choice([-1, 0, 0, 0, 1], n_snapshots) * rng.choice([1, 5, 10], n_snapshots)
+    mid_price = 34000 + np.cumsum(moves)*0.1
+    times = pd.date_range(start, periods=n_snapshots, freq=interval, tz='UTC')
+    keys = [time_.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z' for time_ in times]
+
+    # -- Levels of all the orderbooks (rows of orderbook k are k*depth:(k+1)*depth) -- #
+    spread = np.repeat(rng.choice([1, 1, 2, 5], n_snapshots)*0.5, depth)
+    steps = np.tile(np.arange(depth), n_snapshots)*0.7
+    mid = np.repeat(mid_price, depth)
+
+    values = {'bid_size': rng.choice([0.1, 0.5, 1.0, 2.0], n_snapshots*depth) * rng.integers(1, 4, n_snapshots*depth),
+              'bid': np.round(mid - spread - steps, 1),
+              'ask': np.round(mid + spread + steps, 1),
+              'ask_size': rng.choice([0.1, 0.5, 1.0, 2.0], n_snapshots*depth) * rng.integers(1, 4, n_snapshots*depth)}
+
+    ob_data = OrderBook(keys, times.tz_convert(None).values.astype('datetime64[ns]').view(np.int64),
+                        np.arange(n_snapshots + 1)*depth, **values)
+
+    return ob_data if columnar else {key: ob_data[key] for key in ob_data}
+
+### Function definition for synthetic public trades
+def synthetic_trades(n_trades:int=30000,
+                     start:str='2021-07-05 13:00',
+                     seed:int=0) -> pd.DataFrame:
+
+    """
+    Synthetic public trades generator with the structure of pt_data (timestamp, price, amount and side), trades
+    are 0 to 300 milliseconds apart and two out of three are sell orders
+
+    Parameters
+    ----------
+
+    n_trades: int (default:30000) --> Optional parameter
+        Number of trades
+
+    start: str (default:'2021-07-05 13:00') --> Optional parameter
+        Timestamp of the first trade
+
+    seed: int (default:0) --> Optional parameter
+        Seed of the random generator
+
+    Returns
+    -------
+
+    pt_data: pd.DataFrame
+        Public trades data frame
+    """
+
+    rng = np.random.default_rng(seed)
+    times = pd.Timestamp(start) + pd.to_timedelta(np.cumsum(rng.integers(0, 300, n_trades)), unit='ms')
+
+    return pd.DataFrame({'timestamp': times.strftime('%Y-%m-%d %H:%M:%S.%f'),
+                         'price': np.round(34000 + rng.random(n_trades)*10, 2),
+                         'amount': np.round(rng.random(n_trades), 5),
+                         'side': rng.choice(['sell', 'sell', 'buy'], n_trades)})
+
+# ===================================== Benchmark harness ================================================= #
+
+### Data sizes of each scale (orderbooks, levels, trades)
+SCALES = {'small': (3600, 25, 30000), 'medium': (36000, 25, 300000), 'large': (360000, 25, 3000000)}
+
+### Default baseline file
+BASELINE_PATH = 'benchmarks_baseline.json'
+
+### Time (best of repeat) and peak memory of a function
+def _measure(func, setup, repeat:int) -> tuple:
+    seconds = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        func(*args)
+        seconds.append(time.perf_counter() - start)
+
+    # Peak memory in a separated run, tracemalloc slows down the function
+    args = setup()
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return min(seconds), peak / 2**20
+
+### Function definition for the benchmark cases
+def run_benchmarks(scales:list=None,
+                   repeat:int=3) -> dict:
+
+    """
+    Benchmark of the model functions (apt_check_all, apt_check_tob and roll_model_check) and the chart builders
+    of visualizations.py with synthetic data of each scale
+
+    Parameters
+    ----------
+
+    scales: list (default:None) --> Optional parameter
+        Names of the scales to run (see SCALES), ['small', 'medium'] if it's None
+
+    repeat: int (default:3) --> Optional parameter
+        Number of timed runs of each case, the best one is reported
+
+    Returns
+    -------
+
+    r_data: dict
+        Return data, it's a nested dict case --> scale --> {'seconds', 'throughput', 'peak_mb'}, where throughput
+        is orderbooks per second (trades per second for plot_prob_evo)
+
+    References
+    ----------
+
+    [1] https://docs.python.org/3/library/tracemalloc.html
+    """
+
+    r_data = {}
+    for scale in scales or ['small', 'medium']:
+        n_snapshots, depth, n_trades = SCALES[scale]
+        ob_data = synthetic_orderbooks(n_snapshots, depth, columnar=True)
+        pt_data = synthetic_trades(n_trades)
+
+        # Fresh derived arrays on each run (top_of_book is memoized on the OrderBook)
+        fresh = lambda: ob_data.features.clear() or (ob_data,)
+        apt_result = fn.apt_check_all(ob_data)['simple_mid_price']
+        roll_result = fn.roll_model_check(ob_data, pt_data)
+
+        cases = {'apt_check_all': (fn.apt_check_all, fresh, n_snapshots),
+                 'apt_check_tob': (fn.apt_check_tob, fresh, n_snapshots),
+                 'roll_model_check': (fn.roll_model_check, lambda: fresh() + (pt_data,), n_snapshots),
+                 'plot_stacked_bar': (vz.plot_stacked_bar, lambda: (apt_result,), n_snapshots),
+                 'plot_teo_spread': (lambda data: dict(vz.plot_teo_spread(data)), # all the six figures
+                                     lambda: (roll_result['spread_definition'],), n_snapshots),
+                 'plot_prob_evo': (vz.plot_prob_evo, lambda: (roll_result['prob_evolution'],), n_trades)}
+
+        for case, (func, setup, items) in cases.items():
+            seconds, peak_mb = _measure(func, setup, repeat)
+            r_data.setdefault(case, {})[scale] = {'seconds': seconds, 'throughput': items / seconds,
+                                                  'peak_mb': peak_mb}
+
+    return r_data
+
+### Function definition for the regressions check
+def compare_baseline(results:dict,
+                     baseline:dict,
+                     tolerance:float=0.25) -> list:
+
+    """
+    Cases slower than the baseline by more than the tolerance (0.25 --> 25% slower), as a list of
+    (case, scale, baseline seconds, current seconds) tuples
+    """
+
+    regressions = []
+    for case, scales in results.items():
+        for scale, result in scales.items():
+            reference = baseline.get(case, {}).get(scale)
+            if reference is not None and result['seconds'] > reference['seconds']*(1 + tolerance):
+                regressions.append((case, scale, reference['seconds'], result['seconds']))
+
+    return regressions
+
+# ========================================= Entry point =================================================== #
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the APT and Roll model functions')
+    parser.add_argument('--scales', nargs='+', default=['small', 'medium'], choices=list(SCALES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline json file')
+    parser.add_argument('--save', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scales, args.repeat)
+
+    print(f'{"case":<20}{"scale":<8}{"seconds":>10}{"items/s":>14}{"peak MB":>10}')
+    for case, scales in results.items():
+        for scale, result in scales.items():
+            print(f'{case:<20}{scale:<8}{result["seconds"]:>10.4f}{result["throughput"]:>14,.0f}'
+                  f'{result["peak_mb"]:>10.1f}')
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f'Baseline stored in {args.baseline}')
+
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = compare_baseline(results, json.load(file), args.tolerance)
+
+        for case, scale, reference, current in regressions:
+            print(f'Regression: {case} ({scale}) {reference:.4f}s --> {current:.4f}s')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,204 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- cache.py : It's a python script with the results cache of the model functions                       -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import pandas as pd
+import numpy as np
+import os
+import sys
+import pickle
+import hashlib
+import collections
+import importlib.util
+
+# Required local scripts
+import profiling
+from data import OrderBook, CACHE_DIR
+
+# ===================================== Data fingerprints ================================================= #
+
+### Results location and format version
+RESULTS_DIR = os.path.join(CACHE_DIR, 'results')
+_RESULTS_VERSION = 1
+
+### Hash of the arrays of an orderbook, memoized on the OrderBook (its arrays are read only)
+def _orderbook_fingerprint(ob_data:OrderBook) -> str:
+    if 'fingerprint' not in ob_data.features:
+        digest = hashlib.blake2b(b'OrderBook')
+        for values in [ob_data.timestamps, ob_data.offsets] + [getattr(ob_data, c) for c in OrderBook.columns]:
+            digest.update(np.ascontiguousarray(values).data)
+        ob_data.features['fingerprint'] = digest.hexdigest()
+
+    return ob_data.features['fingerprint']
+
+### Hash of a data frame (column names, dtypes, index and values)
+def _frame_fingerprint(frame:pd.DataFrame) -> str:
+    digest = hashlib.blake2b(b'DataFrame')
+    digest.update(repr([(str(column), str(dtype)) for column, dtype in frame.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=True).values.data)
+
+    return digest.hexdigest()
+
+### Hash of any argument of the model functions
+def fingerprint(value) -> str:
+
+    """
+    Fingerprint of an argument of the model functions. Orderbooks (OrderBook or dict of data frames) and data
+    frames are hashed by content, numpy arrays by dtype, shape and bytes, and the rest of the values by repr
+    """
+
+    if isinstance(value, OrderBook):
+        return _orderbook_fingerprint(value)
+
+    if isinstance(value, pd.DataFrame):
+        return _frame_fingerprint(value)
+
+    if isinstance(value, np.ndarray):
+        digest = hashlib.blake2b(repr((value.dtype.str, value.shape)).encode())
+        digest.update(np.ascontiguousarray(value).data)
+        return digest.hexdigest()
+
+    if isinstance(value, dict) and value and all(isinstance(v, pd.DataFrame) for v in value.values()):
+        return _orderbook_fingerprint(OrderBook.from_frames(value))
+
+    return hashlib.blake2b(repr(value).encode()).hexdigest()
+
+### Local modules the results depend on (model functions, their kernels and the OrderBook container)
+_CODE_MODULES = ['functions', 'kernels', 'data']
+
+### Hash of the source files of a module and of _CODE_MODULES, the results are invalid when that code changes
+_code_hashes = {}
+
+def _code_fingerprint(module_name:str) -> str:
+    if module_name not in _code_hashes:
+        digest = hashlib.blake2b()
+        for name in [module_name] + [name for name in _CODE_MODULES if name != module_name]:
+            module = sys.modules.get(name)
+            spec = None if module is not None else importlib.util.find_spec(name)
+            path = getattr(module, '__file__', None) if module is not None else getattr(spec, 'origin', None)
+            if path is not None and os.path.isfile(path):
+                with open(path, 'rb') as file:
+                    digest.update(name.encode() + hashlib.blake2b(file.read()).digest())
+        _code_hashes[module_name] = digest.hexdigest()
+
+    return _code_hashes[module_name]
+
+# ====================================== Results cache ==================================================== #
+
+### Class definition
+class ResultCache:
+
+    """
+    Cache of the results of the model functions (apt_check_all, apt_check_tob, roll_model_check...). Each result
+    is keyed by the function, the fingerprint of its data arguments (see fingerprint), its parameters and the
+    source code of the function module and of the modules behind it (functions, kernels and data), so a result is
+    only returned while all of them are the same. Results are kept in memory (least recently used are evicted) and
+    stored on disk as pickle files, so other processes and the next runs reuse them
+
+    Parameters
+    ----------
+
+    folder: str (default:RESULTS_DIR) --> Optional parameter
+        Folder of the result files, results are only kept in memory if it's None
+
+    maxsize: int (default:32) --> Optional parameter
+        Number of results kept in memory
+
+    References
+    ----------
+
+    [1] https://docs.python.org/3/library/pickle.html
+    """
+
+    def __init__(self, folder:str=RESULTS_DIR, maxsize:int=32):
+
+        self.folder = folder
+        self.maxsize = maxsize
+        self._memory = collections.OrderedDict()
+
+    def key(self, func, *args, **kwargs) -> str:
+
+        """ Cache key of a function call """
+
+        digest = hashlib.blake2b(repr((_RESULTS_VERSION, func.__module__, func.__qualname__,
+                                       _code_fingerprint(func.__module__))).encode())
+        for value in args:
+            digest.update(fingerprint(value).encode())
+        for name in sorted(kwargs):
+            digest.update(name.encode() + fingerprint(kwargs[name]).encode())
+
+        return digest.hexdigest()
+
+    def call(self, func, *args, **kwargs):
+
+        """
+        Result of func(*args, **kwargs), from the cache when it's there. Cached results are shared by all the
+        callers of the same process, so they must not be modified
+        """
+
+        key = self.key(func, *args, **kwargs)
+
+        # -- Memory and disk lookup -- #
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            profiling.count('result_cache_hits')
+            return self._memory[key]
+
+        path = None if self.folder is None else os.path.join(self.folder, key + '.pkl')
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as file:
+                r_data = pickle.load(file)
+            profiling.count('result_cache_hits')
+            self._remember(key, r_data)
+            return r_data
+
+        # -- Calculation and storage -- #
+        profiling.count('result_cache_misses')
+        r_data = func(*args, **kwargs)
+
+        if path is not None:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(path + '.tmp', 'wb') as file:
+                pickle.dump(r_data, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+        self._remember(key, r_data)
+
+        return r_data
+
+    def clear(self, disk:bool=False):
+
+        """ Drop the results in memory, and the result files if disk is True """
+
+        self._memory.clear()
+        if disk and self.folder is not None and os.path.isdir(self.folder):
+            for name in os.listdir(self.folder):
+                if name.endswith('.pkl'):
+                    os.remove(os.path.join(self.folder, name))
+
+    def _remember(self, key:str, r_data):
+        self._memory[key] = r_data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+### Default results cache
+results = ResultCache()
+
+### Function definition for cached calls
+def cached(func, *args, **kwargs):
+
+    """
+    Result of func(*args, **kwargs) from the default results cache (see ResultCache), for example
+    cached(fn.roll_model_check, ob_data, pt_data, windows=['5min'])
+    """
+
+    return results.call(func, *args, **kwargs)
@@ -0,0 +1,45 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- conftest.py : It's a python script with the shared fixtures of the tests                            -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import pandas as pd
+import numpy as np
+import pytest
+
+# Required local scripts
+import functions as fn
+import kernels
+
+# ======================================== Test fixtures ================================================== #
+
+### Every backend, the ones that aren't installed are skipped
+@pytest.fixture(params=['numpy', 'numba'])
+def backend(request):
+    if request.param not in kernels.BACKENDS:
+        pytest.skip(f'{request.param} backend is not available')
+
+    previous = fn.get_backend()
+    fn.set_backend(request.param)
+    yield request.param
+    fn.set_backend(previous)
+
+### Orderbook levels with repeated prices (prices on a 0.1 grid and a few volumes)
+@pytest.fixture
+def levels() -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    size = 5000
+
+    return pd.DataFrame({'bid_size': rng.choice([0.1, 0.5, 1.0, 2.5], size),
+                         'bid': np.round(34000 - rng.integers(1, 20, size)*0.1, 1),
+                         'ask': np.round(34000 + rng.integers(1, 20, size)*0.1, 1),
+                         'ask_size': rng.choice([0.1, 0.5, 1.0, 2.5], size),
+                         'bucket': np.sort(rng.integers(0, 40, size))})
@@ -1,4 +1,3 @@
-
 """
 # -- --------------------------------------------------------------------------------------------------- -- #
 # -- project: Asset Pricing Theory empirical definition                                                  -- #
@@ -13,29 +12,675 @@
 
 ### Libraries to use
 import pandas as pd
+import numpy as np
+import os
 import json
+import re
+import hashlib
+import itertools
+import functools
+import shutil
+import tempfile
+from array import array
+from collections.abc import Mapping
 
-# ================================= Data object definition ================================================ #
+# Required local scripts
+import profiling
+
+# ================================ Columnar orderbook container =========================================== #
+
+### Class definition
+class OrderBook(Mapping):
+
+    """
+    Columnar orderbook container. All the levels of all the orderbooks are stored in four flat arrays, and the
+    levels of the orderbook k are the rows offsets[k]:offsets[k+1] of each one of them. It behaves as a read only
+    dict of data frames (timestamp --> orderbook) so it can be used wherever the dict of data frames was used
+
+    Parameters
+    ----------
+
+    keys: list (default:None) --> Required parameter
+        Orderbook timestamps as they come in the source file, they are the keys of the dict-like view
+
+    timestamps: np.ndarray (default:None) --> Required parameter
+        int64 array with the orderbook timestamps in nanoseconds since epoch (UTC)
+
+    offsets: np.ndarray (default:None) --> Required parameter
+        int64 array of len(keys) + 1 elements with the first row of each orderbook in the flat arrays
+
+    bid_size, bid, ask, ask_size: np.ndarray (default:None) --> Required parameters
+        float64 flat arrays with the values of all the levels of all the orderbooks
+    """
+
+    columns = ['bid_size', 'bid', 'ask', 'ask_size']
+
+    def __init__(self, keys:list, timestamps:np.ndarray, offsets:np.ndarray,
+                 bid_size:np.ndarray, bid:np.ndarray, ask:np.ndarray, ask_size:np.ndarray):
+
+        # Read only views, the same container can be shared by several analyses (threads or processes)
+        self.labels = list(keys)
+        self.timestamps = _read_only(timestamps, np.int64)
+        self.offsets = _read_only(offsets, np.int64)
+        self.bid_size = _read_only(bid_size, np.float64)
+        self.bid = _read_only(bid, np.float64)
+        self.ask = _read_only(ask, np.float64)
+        self.ask_size = _read_only(ask_size, np.float64)
+        self._position = {key: k for k, key in enumerate(self.labels)}
+
+        # Derived arrays of the analysis functions, memoized for the container (see functions.top_of_book)
+        self.features = {}
+
+    @classmethod
+    def from_dict(cls, raw_data:dict) -> 'OrderBook':
+
+        """
+        Build the container from the raw structure of the json file (timestamp --> levels). Each orderbook can be
+        a list of levels ({'bid_size': ..., 'bid': ..., ...}) or a dict of columns ({'bid': {'0': ...}, ...}),
+        None orderbooks are dropped
+        """
+
+        return cls.from_snapshots(raw_data.items())
+
+    @classmethod
+    def from_frames(cls, ob_data:dict) -> 'OrderBook':
+
+        """
+        Build the container from a dict of data frames (timestamp --> orderbook) with bid_size, bid, ask and
+        ask_size columns
+        """
+
+        keys = list(ob_data)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(ob_data[key]) for key in keys], out=offsets[1:])
+
+        values = {column: np.concatenate([np.asarray(ob_data[key][column], dtype=np.float64) for key in keys])
+                  if keys else np.empty(0) for column in cls.columns}
+
+        return cls(keys, _to_nanoseconds(keys), offsets, **values)
+
+    @classmethod
+    def from_snapshots(cls, snapshots, start=None, end=None) -> 'OrderBook':
+
+        """
+        Build the container from an iterable of (timestamp, levels) pairs, writing each orderbook straight into
+        compact typed arrays, so the whole set of orderbooks is never held as python objects. None orderbooks and
+        the ones outside of [start, end) are dropped as they come
+        """
+
+        start = None if start is None else _timestamp_ns(start)
+        end = None if end is None else _timestamp_ns(end)
+
+        keys = []
+        timestamps = array('q')
+        offsets = array('q', [0])
+        values = {column: array('d') for column in cls.columns}
+
+        for key, levels in snapshots:
+            if levels is None:
+                continue
+
+            timestamp = _timestamp_ns(key)
+            if (start is not None and timestamp < start) or (end is not None and timestamp >= end):
+                continue
+
+            levels = _levels_to_columns(levels)
+            keys.append(key)
+            timestamps.append(timestamp)
+            offsets.append(offsets[-1] + len(levels['bid']))
+            for column in cls.columns:
+                # Each column is converted before it's appended, so a failed conversion leaves the buffer as it was
+                try:
+                    column_values = array('d', levels[column])
+                except TypeError: # Missing values in the level
+                    column_values = array('d', [np.nan if value is None else value for value in levels[column]])
+                values[column].extend(column_values)
+
+        return cls(keys, np.frombuffer(timestamps, dtype=np.int64), np.frombuffer(offsets, dtype=np.int64),
+                   **{column: np.frombuffer(values[column], dtype=np.float64) for column in cls.columns})
+
+    def take(self, positions:np.ndarray) -> 'OrderBook':
+
+        """
+        New container with the orderbooks at the given positions (integer positions or a boolean mask)
+        """
+
+        positions = np.arange(len(self))[positions]
+        lengths = self.levels[positions]
+        starts = self.offsets[positions]
+
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        rows = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+        return OrderBook([self.labels[k] for k in positions], self.timestamps[positions], offsets,
+                         **{column: getattr(self, column)[rows] for column in self.columns})
+
+    def between(self, start=None, end=None) -> 'OrderBook':
+
+        """
+        New container with the orderbooks whose timestamp is in [start, end), both bounds are optional and they
+        are taken as UTC when they don't have a timezone
+        """
+
+        if not np.all(self.timestamps[1:] >= self.timestamps[:-1]):
+            return self.take(_time_mask(self.timestamps, start, end))
+
+        # Sorted timestamps, the range is a contiguous block of orderbooks
+        first = 0 if start is None else int(np.searchsorted(self.timestamps, _timestamp_ns(start), 'left'))
+        last = len(self) if end is None else int(np.searchsorted(self.timestamps, _timestamp_ns(end), 'left'))
+
+        return self.subset(first, max(first, last))
+
+    def subset(self, first:int, last:int) -> 'OrderBook':
+
+        """
+        New container with the orderbooks first:last, the level arrays are views of the current ones (no copy)
+        """
+
+        rows = slice(self.offsets[first], self.offsets[last])
+
+        return OrderBook(self.labels[first:last], self.timestamps[first:last],
+                         self.offsets[first:last+1] - self.offsets[first],
+                         **{column: getattr(self, column)[rows] for column in self.columns})
+
+    def arrays(self) -> dict:
+
+        """ Dict with all the arrays of the container (labels included) """
+
+        return {'labels': np.array(self.labels, dtype=str), 'timestamps': self.timestamps,
+                'offsets': self.offsets, **{column: getattr(self, column) for column in self.columns}}
+
+    @property
+    def levels(self) -> np.ndarray:
+
+        """ Number of levels of each orderbook """
+
+        return np.diff(self.offsets)
+
+    def __getitem__(self, key) -> pd.DataFrame:
+        k = self._position[key]
+        start, end = self.offsets[k], self.offsets[k+1]
+
+        return pd.DataFrame({column: getattr(self, column)[start:end] for column in self.columns})
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __contains__(self, key) -> bool:
+        return key in self._position
+
+# ====================================== Helper functions ================================================= #
+
+### Read only view of an array
+def _read_only(values, dtype) -> np.ndarray:
+    values = np.asarray(values, dtype=dtype).view()
+    values.setflags(write=False)
+
+    return values
+
+### Orderbook levels as a dict of columns
+def _levels_to_columns(levels) -> dict:
+    if isinstance(levels, dict):
+        return {column: list(levels[column].values()) if isinstance(levels[column], dict) else levels[column]
+                for column in OrderBook.columns}
+
+    return {column: [level[column] for level in levels] for column in OrderBook.columns}
+
+### Boolean mask of the timestamps (int64 nanoseconds) within [start, end)
+def _time_mask(timestamps:np.ndarray, start=None, end=None) -> np.ndarray:
+    mask = np.ones(len(timestamps), dtype=bool)
+    if start is not None:
+        mask &= timestamps >= _timestamp_ns(start)
+    if end is not None:
+        mask &= timestamps < _timestamp_ns(end)
+
+    return mask
+
+### Single timestamp as int64 nanoseconds since epoch (UTC)
+def _timestamp_ns(value) -> int:
+    value = pd.Timestamp(value)
+    if value.tz is not None:
+        value = value.tz_convert(None)
+
+    return value.value
+
+### Timestamps as int64 nanoseconds since epoch (UTC)
+def _to_nanoseconds(values) -> np.ndarray:
+    times = pd.to_datetime(pd.Series(list(values), dtype=object), utc=True).dt.tz_convert(None)
+
+    return times.values.astype('datetime64[ns]').view(np.int64)
+
+# ================================== Streaming json reader ================================================ #
+
+### Class definition
+class _JsonStream:
+
+    """
+    Incremental reader over a json file. The file is read by chunks and only the value being decoded is kept in
+    memory, so objects with millions of members can be walked member by member
+    """
+
+    _whitespace = re.compile(r'[ \t\n\r]*')
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, file, chunk_size:int):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self, size:int):
+        chunk = self.file.read(size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+
+    def peek(self) -> str:
+
+        """ Next non whitespace character (it's not consumed) """
+
+        while True:
+            self.pos = self._whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                raise ValueError('Unexpected end of the json document')
+            self._read(self.chunk_size)
+
+    def expect(self, char:str):
+        if self.peek() != char:
+            raise ValueError(f'Expected {char!r} in the json document, found {self.buffer[self.pos]!r}')
+        self.pos += 1
+
+    def value(self):
+
+        """ Decode the next json value, reading more data until it's complete """
+
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer could continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read(max(self.chunk_size, len(self.buffer)))
+
+    def members(self):
+
+        """ Keys of the next json object, the value of each key has to be consumed before the next one """
+
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
 
-### Let's start for the OrderBook data
-file = open('files/orderbooks_05jul21.json')
-orderbooks = json.load(file)
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
 
-# Take each one of the exchanges
-ob_data_bit = orderbooks['bitfinex']
-ob_data_kra = orderbooks['kraken']
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect('}')
+                return
 
-# Drop None keys
-ob_data_bit = {key: value for key, value in ob_data_bit.items() if value is not None}
-ob_data_kra = {key: value for key, value in ob_data_kra.items() if value is not None}
+### Function definition for streaming orderbooks
+def iter_orderbooks(path:str,
+                    exchanges:list=None,
+                    chunk_size:int=1 << 20):
+
+    """
+    Streaming orderbook reader for the {exchange: {timestamp: levels}} layout of the orderbooks json file. It
+    yields one orderbook at a time, so the memory in use doesn't depend on the file size
+
+    Parameters
+    ----------
+
+    path: str (default:None) --> Required parameter
+        Path of the orderbooks json file
+
+    exchanges: list (default:None) --> Optional parameter
+        Exchanges to read, all of them if it's None. Reading stops once all of them were found
+
+    chunk_size: int (default:1 MB) --> Optional parameter
+        Number of characters read from the file each time
+
+    Yields
+    ------
+
+    (exchange, timestamp, levels): tuple
+        Exchange key, orderbook timestamp (as it comes in the file) and levels of each not None orderbook
+    """
+
+    pending = None if exchanges is None else set(exchanges)
+
+    with open(path) as file:
+        stream = _JsonStream(file, chunk_size)
+
+        for exchange in stream.members():
+            wanted = pending is None or exchange in pending
+
+            for timestamp in stream.members():
+                levels = stream.value()
+                if wanted and levels is not None:
+                    yield exchange, timestamp, levels
+
+            if pending is not None:
+                pending.discard(exchange)
+                if not pending:
+                    return
+
+# ===================================== Binary data cache ================================================= #
+
+### Default source files
+OB_PATH = 'files/orderbooks_05jul21.json'
+PT_PATH = 'files/btcusdt_binance.csv'
+
+### Cache location and format version
+CACHE_DIR = 'files/cache'
+_CACHE_VERSION = 1
+
+### Cache folder of a source file (source files with the same name in other folders have their own cache)
+def _cache_folder(path:str, name:str) -> str:
+    location = hashlib.blake2b(os.path.abspath(path).encode(), digest_size=8).hexdigest()
+    return os.path.join(CACHE_DIR, f'{os.path.basename(path)}-{location}', name)
+
+### Size, modification time and hash of a source file
+def _source_info(path:str) -> dict:
+    stat = os.stat(path)
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 24), b''):
+            digest.update(chunk)
+
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest.hexdigest()}
+
+### Read the cached arrays of a source file (memory mapped), None if there isn't a valid cache
+def _read_cache(path:str, name:str):
+    folder = _cache_folder(path, name)
+    meta_path = os.path.join(folder, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path) as file:
+        meta = json.load(file)
+
+    stat = os.stat(path)
+    if meta['version'] != _CACHE_VERSION or meta['source']['size'] != stat.st_size:
+        return None
+
+    # Same size but a different modification time, it's still valid if the content didn't change
+    if meta['source']['mtime_ns'] != stat.st_mtime_ns:
+        source = _source_info(path)
+        if meta['source']['hash'] != source['hash']:
+            return None
+        meta['source'] = source
+        _write_meta(folder, meta)
+
+    arrays = {key: np.load(os.path.join(folder, key + '.npy'), mmap_mode='r') for key in meta['arrays']}
+
+    return meta, arrays
+
+### Write the arrays of a source file into the cache (meta.json is written last, it marks a complete cache)
+def _write_cache(path:str, name:str, source:dict, arrays:dict, **extra):
+    folder = _cache_folder(path, name)
+    os.makedirs(os.path.dirname(folder), exist_ok=True)
+
+    # -- The new cache is written in a temporary folder, files memory-mapped by other processes are never rewritten -- #
+    new_folder = tempfile.mkdtemp(prefix=f'.{name}-', dir=os.path.dirname(folder))
+    for key, values in arrays.items():
+        np.save(os.path.join(new_folder, key + '.npy'), np.ascontiguousarray(values))
+    _write_meta(new_folder, {'version': _CACHE_VERSION, 'source': source, 'arrays': list(arrays), **extra})
+
+    # -- Swap of the folders, the old files are unlinked but their open maps stay valid -- #
+    old_folder = None
+    if os.path.exists(folder):
+        old_folder = tempfile.mkdtemp(prefix=f'.{name}-old-', dir=os.path.dirname(folder))
+        os.replace(folder, os.path.join(old_folder, name))
+    try:
+        os.replace(new_folder, folder)
+    except OSError: # Another process wrote the same cache in the meantime
+        shutil.rmtree(new_folder, ignore_errors=True)
+    if old_folder is not None:
+        shutil.rmtree(old_folder, ignore_errors=True)
+
+def _write_meta(folder:str, meta:dict):
+    with open(os.path.join(folder, 'meta.json.tmp'), 'w') as file:
+        json.dump(meta, file)
+    os.replace(os.path.join(folder, 'meta.json.tmp'), os.path.join(folder, 'meta.json'))
+
+### OrderBook from the cached arrays
+def _cached_orderbook(path:str, exchange:str):
+    cached = _read_cache(path, exchange)
+    if cached is None:
+        return None
+
+    arrays = cached[1]
+
+    return OrderBook(arrays['labels'].tolist(), arrays['timestamps'], arrays['offsets'],
+                     **{column: arrays[column] for column in OrderBook.columns})
+
+### Public trades arrays from the cache (memory mapped) and the side names
+def _cached_trades(path:str):
+    cached = _read_cache(path, 'trades')
+    if cached is None:
+        return None
+
+    meta, arrays = cached
+
+    return arrays, meta['sides']
+
+### Typed arrays of the public trades (timestamp nanoseconds, price, amount and side codes) and the side names
+def _trades_arrays(pt_data:pd.DataFrame) -> tuple:
+    side = pd.Categorical(pt_data['side'])
+    arrays = {'timestamp': _to_nanoseconds(pt_data['timestamp']),
+              'price': pt_data['price'].values.astype(np.float64),
+              'amount': pt_data['amount'].values.astype(np.float64),
+              'side': side.codes.astype(np.int8)}
+
+    return arrays, list(side.categories)
+
+### Public trades data frame over the typed arrays (no copy, the arrays are read only)
+def _trades_frame(arrays:dict, sides:list) -> pd.DataFrame:
+    arrays = {key: _read_only(values, values.dtype) for key, values in arrays.items()}
+
+    return pd.DataFrame({'timestamp': arrays['timestamp'].view('datetime64[ns]'),
+                         'price': arrays['price'], 'amount': arrays['amount'],
+                         'side': pd.Categorical.from_codes(arrays['side'], sides)}, copy=False)
+
+### Function definition for the conversion step
+def convert_sources(ob_path:str=OB_PATH,
+                    pt_path:str=PT_PATH,
+                    exchanges:list=None):
+
+    """
+    Conversion of the source files into the binary cache. Each exchange of the orderbooks file is written as a
+    set of typed .npy arrays (labels, timestamps, offsets and the four level columns) and the public trades as
+    timestamp, price, amount and side code arrays. The next loads memory-map them, so there isn't any text parsing
+    and several processes can share the same copy of the data
+
+    Parameters
+    ----------
+
+    ob_path: str (default:OB_PATH) --> Optional parameter
+        Path of the orderbooks json file, None to skip it
+
+    pt_path: str (default:PT_PATH) --> Optional parameter
+        Path of the public trades csv file, None to skip it
+
+    exchanges: list (default:None) --> Optional parameter
+        Exchanges to convert, all of them if it's None
+
+    References
+    ----------
+
+    [1] https://numpy.org/doc/stable/reference/generated/numpy.load.html
+    """
+
+    if ob_path is not None:
+        source = _source_info(ob_path)
+        converted = set()
+        for exchange, snapshots in itertools.groupby(iter_orderbooks(ob_path, exchanges), key=lambda x: x[0]):
+            with profiling.stage('convert_orderbooks'):
+                ob_data = OrderBook.from_snapshots((timestamp, levels) for _, timestamp, levels in snapshots)
+                _write_cache(ob_path, exchange, source, ob_data.arrays())
+            converted.add(exchange)
+            profiling.count('snapshots_converted', len(ob_data))
+
+        # Requested exchanges that aren't in the file (or only have None orderbooks) are cached as empty
+        for exchange in set(exchanges or []) - converted:
+            _write_cache(ob_path, exchange, source, OrderBook.from_snapshots([]).arrays())
+
+    if pt_path is not None:
+        source = _source_info(pt_path)
+        with profiling.stage('convert_trades'):
+            pt_data = pd.read_csv(pt_path, usecols=['timestamp', 'price', 'amount', 'side'])
+            arrays, sides = _trades_arrays(pt_data)
+            _write_cache(pt_path, 'trades', source, arrays, sides=sides)
+        profiling.count('trades_converted', len(pt_data))
+
+# ====================================== Data loaders ===================================================== #
+
+### Function definition for OrderBook data
+@functools.lru_cache(maxsize=None)
+@profiling.timed('load_orderbooks')
+def load_orderbooks(exchange:str='bitfinex',
+                    start=None,
+                    end=None,
+                    path:str=OB_PATH,
+                    cache:bool=True) -> OrderBook:
+
+    """
+    OrderBook data loader. Only the orderbooks of the requested exchange and time range are converted, and the
+    result is cached, so the next calls with the same arguments don't touch the source file again
+
+    Parameters
+    ----------
+
+    exchange: str (default:'bitfinex') --> Optional parameter
+        Exchange key in the orderbooks file ('bitfinex' or 'kraken')
+
+    start: str or datetime (default:None) --> Optional parameter
+        First timestamp to load (inclusive), UTC if it doesn't have a timezone
+
+    end: str or datetime (default:None) --> Optional parameter
+        Last timestamp to load (exclusive), UTC if it doesn't have a timezone
+
+    path: str (default:OB_PATH) --> Optional parameter
+        Path of the orderbooks json file
+
+    cache: bool (default:True) --> Optional parameter
+        Use the binary cache in CACHE_DIR. The first load converts the whole exchange (see convert_sources) and the
+        next ones memory-map it, the cache is rebuilt when the size, modification time and hash of the source
+        file don't match
+
+    Returns
+    -------
+
+    ob_data: OrderBook
+        Columnar orderbook container, it can be used as a dict of data frames (timestamp --> orderbook)
+    """
+
+    if cache:
+        ob_data = _cached_orderbook(path, exchange)
+        if ob_data is None:
+            convert_sources(path, None, [exchange])
+            ob_data = _cached_orderbook(path, exchange)
+
+        ob_data = ob_data.between(start, end) if start is not None or end is not None else ob_data
+
+    else:
+        snapshots = ((timestamp, levels) for _, timestamp, levels in iter_orderbooks(path, [exchange]))
+        ob_data = OrderBook.from_snapshots(snapshots, start, end)
+
+    profiling.count('snapshots', len(ob_data))
+    profiling.count('levels', len(ob_data.bid))
+
+    return ob_data
+
+### Function definition for Public Trades data
+def load_public_trades(start=None,
+                       end=None,
+                       path:str=PT_PATH,
+                       cache:bool=True) -> pd.DataFrame:
+
+    """
+    Public Trades data loader. The result is cached, so the next calls with the same arguments don't touch the
+    source file again. Each call returns its own data frame over the same read only arrays (memory mapped with
+    the cache, no copies), columns can be added or replaced but the values can't be changed in place
+
+    Parameters
+    ----------
+
+    start: str or datetime (default:None) --> Optional parameter
+        First timestamp to load (inclusive)
+
+    end: str or datetime (default:None) --> Optional parameter
+        Last timestamp to load (exclusive)
+
+    path: str (default:PT_PATH) --> Optional parameter
+        Path of the public trades csv file
+
+    cache: bool (default:True) --> Optional parameter
+        Use the binary cache in CACHE_DIR (see load_orderbooks)
+
+    Returns
+    -------
+
+    pt_data: pd.DataFrame
+        Public trades data frame with timestamp (datetime64), price, amount and side (categorical) columns, the
+        same with and without the cache
+    """
+
+    return _load_public_trades(start, end, path, cache).copy(deep=False)
+
+### Public trades shared by all the calls with the same arguments (over read only arrays)
+@functools.lru_cache(maxsize=None)
+@profiling.timed('load_public_trades')
+def _load_public_trades(start, end, path:str, cache:bool) -> pd.DataFrame:
+    if cache:
+        cached = _cached_trades(path)
+        if cached is None:
+            convert_sources(None, path)
+            cached = _cached_trades(path)
+        arrays, sides = cached
+    else:
+        arrays, sides = _trades_arrays(pd.read_csv(path, usecols=['timestamp', 'price', 'amount', 'side']))
+
+    if start is not None or end is not None:
+        times = arrays['timestamp']
+        if np.all(times[1:] >= times[:-1]):
+            # Sorted trades, the range is a contiguous block (views of the arrays)
+            first = 0 if start is None else int(np.searchsorted(times, _timestamp_ns(start), 'left'))
+            last = len(times) if end is None else int(np.searchsorted(times, _timestamp_ns(end), 'left'))
+            arrays = {key: values[first:max(first, last)] for key, values in arrays.items()}
+        else:
+            mask = _time_mask(times, start, end)
+            arrays = {key: values[mask] for key, values in arrays.items()}
+
+    profiling.count('trades', len(arrays['timestamp']))
+
+    return _trades_frame(arrays, sides)
+
+# ================================= Data object definition ================================================ #
 
-# Convert into pandas dataframe and rearange columns
-ob_data_bit = {orderbook: pd.DataFrame(ob_data_bit[orderbook])[['bid_size', 'bid', 'ask', 'ask_size']]
-               for orderbook in list(ob_data_bit.keys())}
+### Module attributes loaded on first access (ob_data_bit, ob_data_kra and pt_data)
+_lazy_data = {'ob_data_bit': lambda: load_orderbooks('bitfinex'),
+              'ob_data_kra': lambda: load_orderbooks('kraken'),
+              'pt_data': lambda: load_public_trades()}
 
-ob_data_kra = {orderbook: pd.DataFrame(ob_data_kra[orderbook])[['bid_size', 'bid', 'ask', 'ask_size']]
-               for orderbook in list(ob_data_kra.keys())}
+def __getattr__(name:str):
+    if name in _lazy_data:
+        return _lazy_data[name]()
 
-### Now let's extract the Public Trades data
-pt_data = pd.read_csv('files/btcusdt_binance.csv')
-pt_data.drop(['Unnamed: 0'], axis=1, inplace=True)
\ No newline at end of file
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
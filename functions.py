@@ -14,22 +14,486 @@
 ### Libraries to use
 import pandas as pd
 import numpy as np
-import datetime
 from statsmodels.tsa.stattools import acovf, acf
 
+# Required local scripts
+import kernels
+import profiling
+from data import OrderBook, _timestamp_ns
+
+# ====================================== Helper functions ================================================= #
+
+### Constants
+_MINUTE_NS = 60 * 10**9
+_DAY_NS = 24 * 60 * _MINUTE_NS
+
+### Numeric kernels in use (see kernels.py and set_backend)
+_backend = 'numpy'
+_kernels = kernels.BACKENDS[_backend]
+
+### Function definition for the kernels backend
+def set_backend(name:str):
+
+    """
+    Backend of the numeric kernels (weighted mid-prices, Exp 1 counts and Roll model moments): 'numpy' (default)
+    or 'numba', available when numba is installed. Both give the same results
+    """
+
+    global _backend, _kernels
+    if name not in kernels.BACKENDS:
+        raise ValueError(f"Backend {name!r} isn't available, the options are {list(kernels.BACKENDS)}")
+
+    _backend, _kernels = name, kernels.BACKENDS[name]
+
+### Function definition to check the kernels backend
+def get_backend() -> str:
+    return _backend
+
+### Orderbook data as a columnar container
+def _as_orderbook(ob_data) -> OrderBook:
+    return ob_data if isinstance(ob_data, OrderBook) else OrderBook.from_frames(ob_data)
+
+### Bucket start (int64 nanoseconds) of each timestamp, counted from the midnight of the first day like pd.Grouper
+def _bucket_starts(timestamps:np.ndarray, freq:int, origin:int=None) -> np.ndarray:
+    if len(timestamps) == 0:
+        return timestamps
+
+    origin = timestamps.min() - timestamps.min() % _DAY_NS if origin is None else origin
+
+    return timestamps - (timestamps - origin) % freq
+
+### Experiment 1 counts and total of observations on each time bucket, for several prices at once
+def _bucket_counts(values:np.ndarray, timestamps:np.ndarray, freq:int) -> tuple:
+
+    """
+    values is a (observations, prices) array and timestamps the int64 nanoseconds of each observation. Buckets
+    go from the first to the last one (empty ones included, like pd.Grouper) and Exp 1 counts the observations
+    equal to the previous one of the same bucket
+    """
+
+    order = np.argsort(timestamps, kind='stable')
+    values, buckets = values[order], _bucket_starts(timestamps[order], freq)
+
+    codes = (buckets - buckets[0]) // freq
+    n_buckets = int(codes[-1]) + 1
+
+    # Equal consecutive observations of the same bucket
+    exp_1 = _kernels['equal_counts'](np.ascontiguousarray(values), codes, n_buckets)
+    total = np.bincount(codes, minlength=n_buckets)
+    index = pd.DatetimeIndex((buckets[0] + np.arange(n_buckets) * freq).view('datetime64[ns]'))
+
+    return exp_1, total, index
+
+### Centered lag 1 moments of the windows x[starts[i]:i+1] (window size, cross products and squares)
+def _lag1_moments(x:np.ndarray, starts:np.ndarray=None) -> tuple:
+
+    """
+    All the windows are solved with running sums of x, x^2 and x_t*x_t-1, so the whole series costs O(n) for
+    any window (expanding or sliding) instead of O(window) for each one. The series is centered first, the
+    moments don't change and the running sums are better conditioned
+    """
+
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    starts = np.zeros(len(x), dtype=np.int64) if starts is None else np.asarray(starts, dtype=np.int64)
+
+    return _kernels['lag1_moments'](x, starts)
+
+### Lag 1 autocovariance of the windows x[starts[i]:i+1], the same as acovf(window, adjusted=True, nlag=1)[1]
+def _lag1_autocovariance(x:np.ndarray, starts:np.ndarray=None) -> np.ndarray:
+    n, cross, _ = _lag1_moments(x, starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(n > 1, cross / (n - 1), np.nan)
+
+### Lag 1 autocorrelation of the windows x[starts[i]:i+1], the same as acf(window, nlags=1)[1]
+def _lag1_autocorrelation(x:np.ndarray, starts:np.ndarray=None) -> np.ndarray:
+    n, cross, centered_squares = _lag1_moments(x, starts)
+
+    # Constant windows have no variance (acf is nan), but their running sums leave a rounding residual
+    x = np.asarray(x)
+    changes = np.concatenate([[0], np.cumsum(x[1:] != x[:-1])])
+    window_starts = np.zeros(len(x), dtype=np.int64) if starts is None else np.asarray(starts, dtype=np.int64)
+    constant = changes == changes[window_starts]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where((n > 1) & ~constant, cross / centered_squares, np.nan)
+
+### First position of the time window (t - window, t] of each sorted timestamp
+def _window_starts(timestamps:np.ndarray, window:str) -> np.ndarray:
+    if np.any(timestamps[1:] < timestamps[:-1]):
+        raise ValueError('Rolling windows need orderbooks and trades sorted by time')
+
+    return np.searchsorted(timestamps, timestamps - pd.Timedelta(window).value, side='right')
+
+### round(k/n, decimals) of integer arrays, the same result as python round (np.round can differ on the ties)
+def _round_ratio(k:np.ndarray, n:np.ndarray, decimals:int) -> np.ndarray:
+    scale = 10**decimals
+    quotient, remainder = np.divmod(k*scale, n)
+    r_data = (quotient + (2*remainder > n)) / scale
+
+    # Exact ties depend on the binary representation of k/n, they're solved as python does
+    tie = 2*remainder == n
+    r_data[tie] = [round(int(a) / int(b), decimals) for a, b in zip(k[tie], n[tie])]
+
+    return r_data
+
+### Bucket codes (by order of appearance) of int64 timestamps and the bucket start (int64 nanoseconds) of each code
+def _bucket_codes(timestamps:np.ndarray, freq:int, origin:int=None) -> tuple:
+    buckets = _bucket_starts(timestamps, freq, origin)
+    if len(buckets) == 0:
+        return np.zeros(0, dtype=np.int64), buckets
+
+    if np.all(buckets[1:] >= buckets[:-1]):
+        # Sorted orderbooks, a new code on each change of bucket (integer arithmetic only)
+        change = np.concatenate([[True], buckets[1:] != buckets[:-1]])
+        return np.cumsum(change) - 1, buckets[change]
+
+    codes, times = pd.factorize(buckets)
+
+    return codes.astype(np.int64), np.asarray(times)
+
+### Simple and weighted mid-price of each order (levels, 2)
+def _order_prices(ob_data:OrderBook) -> np.ndarray:
+    mid_price = (ob_data.bid + ob_data.ask)*0.5 # Simple mid-price
+    weighted_mid = _kernels['weighted_mid'](ob_data.bid, ob_data.bid_size, ob_data.ask, ob_data.ask_size)
+
+    return np.column_stack([mid_price, np.round(weighted_mid, 2)])
+
+### Validation of the depth options (apt_check_all, apt_check_tob and depth_features)
+def _check_depth(depth:int):
+    if depth < 1:
+        raise ValueError(f'depth must be a positive number of levels, got {depth}')
+
+### Experiment 1 counts of apt_check_all, for the simple and weighted mid-price of all the orders
+def _apt_all_counts(ob_data:OrderBook, freq:int=_MINUTE_NS, depth:int=None, origin:int=None) -> tuple:
+
+    """
+    Buckets (int64 nanoseconds, in order of appearance), Exp 1 counts (buckets, 2), number of orders of each
+    bucket, and the simple and weighted mid-prices of the first and last order (2, 2). Only the first depth
+    levels of each orderbook are taken if depth isn't None, and buckets are counted from origin (the midnight of
+    the first day if it's None)
+    """
+
+    if depth is not None:
+        _check_depth(depth)
+
+    # -- Columnar data, one row for each registered order on each orderbook -- #
+    prices = _order_prices(ob_data)
+
+    # Bucket of each orderbook, coded by order of appearance, and then the code of each order
+    codes, times = _bucket_codes(ob_data.timestamps, freq, origin)
+    codes = np.repeat(codes, ob_data.levels)
+
+    if depth is not None:
+        keep = np.arange(len(codes)) - np.repeat(ob_data.offsets[:-1], ob_data.levels) < depth
+        codes, prices = codes[keep], prices[keep]
+
+    # Orders of the same bucket together (keeping their order) in case of unsorted orderbooks
+    if np.any(codes[1:] < codes[:-1]):
+        order = np.argsort(codes, kind='stable')
+        codes, prices = codes[order], prices[order]
+
+    # Experiment 1 --> mid-price_t == mid-price_t+1
+    # Experiment 2 --> mid-price_t != mid-price_t+1
+    exp_1 = _kernels['equal_counts'](prices, codes, len(times))
+    orders = np.bincount(codes, minlength=len(times))
+
+    return times, exp_1, orders, prices[[0, -1]]
+
+### Result data frames of apt_check_all
+def _apt_all_frames(times:np.ndarray, exp_1:np.ndarray, orders:np.ndarray) -> dict:
+    index = pd.DatetimeIndex(np.asarray(times, dtype=np.int64).view('datetime64[ns]'))
+
+    return {'simple_mid_price': _apt_frame(exp_1[:, 0], orders - 1, index),
+            'weighted_mid_price': _apt_frame(exp_1[:, 1], orders - 1, index)}
+
+### Result data frames of apt_check_tob
+def _apt_tob_frames(exp_1:np.ndarray, total:np.ndarray, index:pd.Index) -> dict:
+    return {'simple_mid_price': _apt_frame(exp_1[:, 0], total, index),
+            'weighted_mid_price_a': _apt_frame(exp_1[:, 1], total, index),
+            'weighted_mid_price_b': _apt_frame(exp_1[:, 2], total, index)}
+
+### Exp 1 counts, observations and first and last prices of each non empty bucket (observations sorted by time)
+def _bucket_summary(values:np.ndarray, buckets:np.ndarray) -> dict:
+    change = np.concatenate([[True], buckets[1:] != buckets[:-1]])
+    codes = np.cumsum(change) - 1
+    firsts = np.flatnonzero(change)
+    lasts = np.append(firsts[1:], len(buckets)) - 1
+
+    return {'times': buckets[change],
+            'exp_1': _kernels['equal_counts'](np.ascontiguousarray(values), codes, len(firsts)),
+            'count': lasts - firsts + 1, 'first': values[firsts], 'last': values[lasts]}
+
+### Summary of coarser buckets (freq is a multiple of the summary one), without the observations
+def _rollup(summary:dict, freq:int, origin:int) -> dict:
+    buckets = _bucket_starts(summary['times'], freq, origin)
+    change = np.concatenate([[True], buckets[1:] != buckets[:-1]])
+    firsts = np.flatnonzero(change)
+    lasts = np.append(firsts[1:], len(buckets)) - 1
+
+    # The last price of a bucket and the first of the next one are also a pair of consecutive observations
+    joins = np.zeros(summary['first'].shape, dtype=np.int64)
+    joins[1:] = (~change[1:, None]) & (summary['last'][:-1] == summary['first'][1:])
+
+    return {'times': buckets[change],
+            'exp_1': np.add.reduceat(summary['exp_1'] + joins, firsts, axis=0),
+            'count': np.add.reduceat(summary['count'], firsts),
+            'first': summary['first'][firsts], 'last': summary['last'][lasts]}
+
+### Result data frames of a bucket summary (the ones of apt_check_tob or apt_check_all)
+def _summary_frames(summary:dict, freq:int, orders:str) -> dict:
+    if orders == 'all':
+        return _apt_all_frames(summary['times'], summary['exp_1'], summary['count'])
+
+    # Top of the book results include the empty buckets (like pd.Grouper)
+    positions = (summary['times'] - summary['times'][0]) // freq
+    exp_1 = np.zeros((positions[-1] + 1, summary['exp_1'].shape[1]), dtype=np.int64)
+    total = np.zeros(positions[-1] + 1, dtype=np.int64)
+    exp_1[positions], total[positions] = summary['exp_1'], summary['count']
+    index = pd.DatetimeIndex((summary['times'][0] + np.arange(len(total)) * freq).view('datetime64[ns]'))
+
+    return _apt_tob_frames(exp_1, total, index)
+
+### Consecutive time windows of an orderbook (views of its arrays, of a sorted copy if it isn't sorted by time)
+def _time_chunks(ob_data:OrderBook, window:int):
+    if len(ob_data) == 0:
+        return
+
+    if not np.all(ob_data.timestamps[1:] >= ob_data.timestamps[:-1]):
+        ob_data = ob_data.take(np.argsort(ob_data.timestamps, kind='stable'))
+
+    start = ob_data.timestamps[0] - ob_data.timestamps[0] % window
+    while start <= ob_data.timestamps[-1]:
+        yield ob_data.between(pd.Timestamp(int(start)), pd.Timestamp(int(start + window)))
+        start += window
+
+### Running moments of a series for its lag 1 autocovariance and autocorrelation
+class _LagOneMoments:
+
+    """
+    Running sums of x, x^2 and x_t*x_t-1 (O(1) time and memory for each new value). The values are shifted by
+    the first one, the moments don't change and the sums are better conditioned
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.shift = self.first = self.last = None
+        self.sum = self.squares = self.pairs = 0.0
+
+    def push(self, x:float):
+        if self.shift is None:
+            self.shift = x
+        x = x - self.shift
+
+        if self.n:
+            self.pairs += x*self.last
+        else:
+            self.first = x
+
+        self.n += 1
+        self.sum += x
+        self.squares += x*x
+        self.last = x
+
+    def _cross(self) -> float:
+
+        """ sum (x_t - mean)(x_t-1 - mean) """
+
+        mean = self.sum / self.n
+        return self.pairs - mean*(2*self.sum - self.first - self.last) + (self.n - 1)*mean**2
+
+    def autocovariance(self) -> float:
+
+        """ The same as acovf(x, adjusted=True, nlag=1)[1] """
+
+        return self._cross() / (self.n - 1) if self.n > 1 else np.nan
+
+    def autocorrelation(self) -> float:
+
+        """ The same as acf(x, nlags=1)[1] """
+
+        if self.n < 2:
+            return np.nan
+        variance = self.squares - self.sum**2 / self.n
+
+        return self._cross() / variance if variance else np.nan
+
+### Data frame with the experiments results of each time bucket
+def _apt_frame(exp_1:np.ndarray, total:np.ndarray, index:pd.Index) -> pd.DataFrame:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_exp_1 = np.round(exp_1 / total, 2)
+
+    frame = pd.DataFrame({'Exp 1': exp_1, 'Exp 2': total - exp_1,
+                          'P. Exp 1': p_exp_1, 'P. Exp 2': 1 - p_exp_1}, index=index)
+    frame.index.name = 'Time'
+
+    return frame
+
+# ================================== Top of the book features ============================================= #
+
+### Function definition for top of the book features
+@profiling.timed('top_of_book')
+def top_of_book(ob_data:dict) -> dict:
+
+    """
+    Top of the book features of all the orderbooks, gathered at once from the columnar data. The result is
+    memoized on the OrderBook, so all the analysis functions share the same arrays
+
+    Parameters
+    ----------
+
+    ob_data:dict (default:None) --> Required parameter
+        Input data from orderbook, an OrderBook (see data.py) or a dict of data frames (timestamp --> orderbook)
+
+    Returns
+    -------
+
+    r_data: dict
+        Return data, it's a dict of float64 arrays (one value for each orderbook) with the following structure:
+
+        'timestamps': int64 orderbook timestamps in nanoseconds (UTC)
+        'bid_size', 'bid', 'ask', 'ask_size': Best bid and ask prices and their volumes
+        'mid_price': Simple mid-price
+        'imbalance': Bid volume over the total volume of all the levels of the orderbook
+        'weighted_mid_a': Imbalance times mid-price, rounded to 2 decimals
+        'weighted_mid_b': Best bid and ask weighted by the opposite volume, rounded to 2 decimals
+    """
+
+    ob_data = _as_orderbook(ob_data)
+    if 'top_of_book' in ob_data.features:
+        return ob_data.features['top_of_book']
+
+    # -- First level of each orderbook -- #
+    first = ob_data.offsets[:-1]
+    bid_size, bid = ob_data.bid_size[first], ob_data.bid[first]
+    ask, ask_size = ob_data.ask[first], ob_data.ask_size[first]
+
+    mid_price = (ask + bid)*0.5
+
+    # -- Imbalance with all the levels (missing volumes are skipped) -- #
+    total_size = ob_data.bid_size + ob_data.ask_size
+    imbalance = (np.add.reduceat(np.where(np.isnan(ob_data.bid_size), 0.0, ob_data.bid_size), first) /
+                 np.add.reduceat(np.where(np.isnan(total_size), 0.0, total_size), first))
+
+    r_data = {'timestamps': ob_data.timestamps, 'bid_size': bid_size, 'bid': bid, 'ask': ask,
+              'ask_size': ask_size, 'mid_price': mid_price, 'imbalance': imbalance,
+              'weighted_mid_a': np.round(imbalance*mid_price, 2),
+              'weighted_mid_b': np.round(_kernels['weighted_mid'](bid, bid_size, ask, ask_size), 2)}
+
+    ob_data.features['top_of_book'] = r_data
+
+    return r_data
+
+### Function definition for cumulative depth
+@profiling.timed('depth_profile')
+def depth_profile(ob_data:dict) -> dict:
+
+    """
+    Cumulative bid and ask volumes of the first N levels of each orderbook, for every N. With these arrays the
+    depth features of any N (see depth_features) are a column lookup instead of a new pass over the levels. The
+    result is memoized on the OrderBook
+
+    Parameters
+    ----------
+
+    ob_data:dict (default:None) --> Required parameter
+        Input data from orderbook, an OrderBook (see data.py) or a dict of data frames (timestamp --> orderbook)
+
+    Returns
+    -------
+
+    r_data: dict
+        Return data, it's a dict of float64 (orderbooks, max depth) arrays where the column N-1 has the sum of the
+        first N levels (the whole orderbook for the ones with less than N levels, missing volumes are skipped):
+
+        'bid_size': Cumulative bid volume
+        'ask_size': Cumulative ask volume
+        'total_size': Cumulative volume of the levels with both bid and ask volumes (see top_of_book)
+    """
+
+    ob_data = _as_orderbook(ob_data)
+    if 'depth_profile' in ob_data.features:
+        return ob_data.features['depth_profile']
+
+    # Orderbook and level position of each row of the flat arrays
+    levels = ob_data.levels
+    rows = np.repeat(np.arange(len(levels)), levels)
+    positions = np.arange(len(rows)) - np.repeat(ob_data.offsets[:-1], levels)
+    max_depth = int(levels.max()) if len(levels) else 0
+
+    r_data = {}
+    total_size = ob_data.bid_size + ob_data.ask_size
+    for name, values in [('bid_size', ob_data.bid_size), ('ask_size', ob_data.ask_size), ('total_size', total_size)]:
+        # Volumes on a (orderbooks, max depth) grid, the cumulative sum is carried over the missing levels
+        grid = np.zeros((len(levels), max_depth))
+        grid[rows, positions] = np.where(np.isnan(values), 0.0, values)
+        r_data[name] = np.cumsum(grid, axis=1)
+
+    ob_data.features['depth_profile'] = r_data
+
+    return r_data
+
+### Function definition for depth features
+def depth_features(ob_data:dict,
+                   depth:int) -> dict:
+
+    """
+    Top of the book features computed with the volumes of the first depth levels (see top_of_book, where all the
+    levels are used for the imbalance and only the first one for the weighted mid-price b)
+
+    Parameters
+    ----------
+
+    ob_data:dict (default:None) --> Required parameter
+        Input data from orderbook, an OrderBook (see data.py) or a dict of data frames (timestamp --> orderbook)
+
+    depth:int (default:None) --> Required parameter
+        Number of levels, orderbooks with less levels use all of them
+
+    Returns
+    -------
+
+    r_data: dict
+        Return data, it's a dict of float64 arrays (one value for each orderbook) with the following structure:
+
+        'imbalance': Bid volume over the total volume of the first depth levels
+        'weighted_mid_a': Imbalance times mid-price, rounded to 2 decimals
+        'weighted_mid_b': Best bid and ask weighted by the opposite volume of the first depth levels, rounded to 2
+                          decimals
+    """
+
+    ob_data = _as_orderbook(ob_data)
+    tob = top_of_book(ob_data)
+    profile = depth_profile(ob_data)
+    _check_depth(depth)
+
+    column = min(depth, profile['bid_size'].shape[1]) - 1
+    bid_size, ask_size = profile['bid_size'][:, column], profile['ask_size'][:, column]
+    imbalance = bid_size / profile['total_size'][:, column]
+
+    r_data = {'imbalance': imbalance,
+              'weighted_mid_a': np.round(imbalance*tob['mid_price'], 2),
+              'weighted_mid_b': np.round(_kernels['weighted_mid'](tob['bid'], bid_size, tob['ask'], ask_size), 2)}
+
+    return r_data
+
 # =================================== APT model check functions =========================================== #
 
 ### Function definition for all orders
-def apt_check_all(ob_data:dict) -> dict:
+@profiling.timed('apt_check_all')
+def apt_check_all(ob_data:dict,
+                  freq:str='1min',
+                  depth:int=None) -> dict:
 
     """
-    Test APT model function (for all orders contained on each orderbook)
+    Test APT model function (for all orders contained on each orderbook). The experiments of all the minutes are
+    computed at once over the columnar orderbook, comparing each order with the next one of the same minute
 
     Parameters
     ----------
 
     ob_data:dict (default:None) --> Required parameter
-        Input data from orderbook, it has to be a dict of data frames with the following structure:
+        Input data from orderbook, it can be an OrderBook (see data.py) or a dict of data frames with the following
+        structure:
 
         'timestamp': Principal key, correspond to the timestamp associated to each orderbook
         'bid_size': First column on each data frame, correspond to the bid volume associated to each bid price order
@@ -37,6 +501,13 @@ def apt_check_all(ob_data:dict) -> dict:
         'ask': Third column of the data frame, correspond to the lowest price a seller is willing to sell
         'ask_size': Fourth column of the data frame, correspond to the ask volume associated to each ask price order
 
+    freq:str (default:'1min') --> Optional parameter
+        Size of the time buckets of the experiments as a pandas time offset ('1s', '10s', '5min', '1h', ...),
+        buckets are counted from the midnight of the first day
+
+    depth:int (default:None) --> Optional parameter
+        Number of levels of each orderbook in the experiments (the first ones), all of them if it's None
+
     Returns
     -------
 
@@ -52,97 +523,116 @@ def apt_check_all(ob_data:dict) -> dict:
     References
     ----------
 
-    [1] https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.groupby.html
+    [1] https://numpy.org/doc/stable/reference/generated/numpy.bincount.html
     """
 
-    # -- General lambda functions definition -- #
-    data_adder = lambda each_list, values: each_list.append(values)
-    w_mid = lambda b,bv,a,av,d: (bv[:d]/np.add(bv[:d],av[:d]))*a[:d] + (av[:d]/np.add(bv[:d],av[:d]))*b[:d]
+    # -- Calculate experiments for mid and weighted-mid prices -- #
+    ob_data = _as_orderbook(ob_data)
+    with profiling.stage('counts'):
+        times, exp_1, orders, _ = _apt_all_counts(ob_data, pd.Timedelta(freq).value, depth)
+    profiling.count('snapshots', len(ob_data))
 
-    # -- Lists to fill -- #
-    exp1_list = []
-    total_list = []
-    exp2_list = []
-    df_list = [] # For big data frame definition
+    # -- Data frame with final results for each -- #
+    with profiling.stage('frames'):
+        r_data = _apt_all_frames(times, exp_1, orders)
+    return r_data
 
-    # -- Generate data frame with all registered orders on each orderbook -- #
-    for i in ob_data:
+### Function definition for all orders, by time windows
+def iter_apt_check_all(ob_data,
+                       window:str='1h',
+                       freq:str='1min',
+                       depth:int=None):
 
-        sub_data = ob_data[i]
-        sub_data['mid_price'] = (sub_data['bid'] + sub_data['ask'])*0.5 # Simple mid-price
-        sub_data['weighted_mid'] = round(w_mid(sub_data['bid'], sub_data['bid_size'],
-                                               sub_data['ask'], sub_data['ask_size'], len(sub_data)), 2)
+    """
+    Test APT model function (for all orders contained on each orderbook), computed one time window at a time so
+    the memory in use depends on the window size and not on the whole data. The buckets that continue from one
+    window to the next one are completed before they're returned
 
-        new_i = pd.to_datetime(i) # Datetime type index
-        sub_data.index = [datetime.datetime(new_i.year, new_i.month,
-                                            new_i.day, new_i.hour, new_i.minute)] * len(sub_data)
-        sub_data.index.name = 'times'
+    Parameters
+    ----------
 
-        data_adder(df_list, sub_data)
+    ob_data:OrderBook (default:None) --> Required parameter
+        Input data from orderbook, it can be an OrderBook (see data.py), which is split in windows of the given size
+        (views of its arrays, no copies, unless it has to be sorted by time first), or any iterable of consecutive
+        OrderBook chunks sorted by time
 
-    final_df = pd.concat(df_list)  # Data frame with all orders information
+    window:str (default:'1h') --> Optional parameter
+        Window size as a pandas time offset ('15min', '1h', ...), only used to split an OrderBook
 
-    # -- Calculate experiments for mid and weighted-mid prices -- #
-    # Experiment 1 --> mid-price_t == mid-price_t+1
-    # Experiment 2 --> mid-price_t != mid-price_t+1
+    freq:str (default:'1min') --> Optional parameter
+        Size of the time buckets of the experiments (see apt_check_all), buckets are counted from the midnight of
+        the first day of the first window
 
-    for i in pd.Series(final_df.index.values).unique():
-        price_data = final_df.loc[i]
+    depth:int (default:None) --> Optional parameter
+        Number of levels of each orderbook in the experiments (the first ones), all of them if it's None
 
-        # Count each scenario data len
-        total = len(price_data) - 1
-        data_adder(total_list, total)
+    Yields
+    ------
 
-        # Experiment 1 definition for each mid-price type
-        e1_mid = sum([price_data['mid_price'][i] == price_data['mid_price'][i+1]
-                      for i in range(len(price_data)-1)])
+    r_data: dict
+        The same dict of data frames of apt_check_all ('simple_mid_price' and 'weighted_mid_price') with the
+        buckets closed on each window
 
-        e1_wmid = sum([price_data['weighted_mid'][i] == price_data['weighted_mid'][i+1]
-                       for i in range(len(price_data)-1)])
+    References
+    ----------
 
-        data_adder(exp1_list, [e1_mid, e1_wmid])
+    [1] https://numpy.org/doc/stable/reference/generated/numpy.bincount.html
+    """
 
-        # Experiment 2 definition for each mid-price type
-        e2_mid = total - e1_mid
-        e2_wmid = total - e1_wmid
+    chunks = _time_chunks(ob_data, pd.Timedelta(window).value) if isinstance(ob_data, OrderBook) else ob_data
 
-        data_adder(exp2_list, [e2_mid, e2_wmid])
+    freq = pd.Timedelta(freq).value
+    if depth is not None:
+        _check_depth(depth)
 
-    # -- Data frame with final results for each -- #
-    simple_mid = pd.DataFrame(columns=['Exp 1', 'Exp 2',
-                                       'P. Exp 1', 'P. Exp 2'])
-
-    weighted_mid = simple_mid.copy()
-
-    simple_mid['Exp 1'] = [i[0] for i in exp1_list]
-    simple_mid['Exp 2'] = [i[0] for i in exp2_list]
-    simple_mid['P. Exp 1'] = np.round(np.array(simple_mid['Exp 1'])/np.array(total_list),2)
-    simple_mid['P. Exp 2'] = 1 - simple_mid['P. Exp 1']
-    simple_mid.index = pd.Series(final_df.index.values).unique()
-    simple_mid.index.name = 'Time'
-
-    weighted_mid['Exp 1'] = [i[1] for i in exp1_list]
-    weighted_mid['Exp 2'] = [i[1] for i in exp2_list]
-    weighted_mid['P. Exp 1'] = np.round(np.array(weighted_mid['Exp 1']) / np.array(total_list), 2)
-    weighted_mid['P. Exp 2'] = 1 - weighted_mid['P. Exp 1']
-    weighted_mid.index = pd.Series(final_df.index.values).unique()
-    weighted_mid.index.name = 'Time'
-
-    # -- Return definition -- #
-    r_data = {'simple_mid_price': simple_mid, 'weighted_mid_price': weighted_mid}
-    return r_data
+    # Last bucket of the previous window (time, Exp 1 counts, orders and mid-prices of its last order)
+    pending = None
+    origin = None
+
+    for chunk in chunks:
+        chunk = _as_orderbook(chunk)
+        if len(chunk) == 0:
+            continue
+
+        # The buckets of all the windows are counted from the same origin
+        if origin is None:
+            origin = chunk.timestamps.min() - chunk.timestamps.min() % _DAY_NS
+        times, exp_1, orders, edges = _apt_all_counts(chunk, freq, depth, origin)
+
+        # -- Bucket that continues from the previous window -- #
+        if pending is not None:
+            if pending[0] == times[0]:
+                exp_1[0] += pending[1] + (pending[3] == edges[0])
+                orders[0] += pending[2]
+            else:
+                times = np.concatenate([[pending[0]], times])
+                exp_1 = np.concatenate([[pending[1]], exp_1])
+                orders = np.concatenate([[pending[2]], orders])
+
+        # The last bucket could continue in the next window
+        pending = (times[-1], exp_1[-1], orders[-1], edges[1])
+        if len(times) > 1:
+            yield _apt_all_frames(times[:-1], exp_1[:-1], orders[:-1])
+
+    if pending is not None:
+        yield _apt_all_frames(*[np.array([value]) for value in pending[:3]])
 
 ### Function definition for top of the book orders
-def apt_check_tob(ob_data:dict) -> dict:
+@profiling.timed('apt_check_tob')
+def apt_check_tob(ob_data:dict,
+                  freq:str='1min',
+                  depth:int=None) -> dict:
 
     """
-    Test APT model function (just for top of the book orders contained on each orderbook)
+    Test APT model function (just for top of the book orders contained on each orderbook). The minutes of all
+    the mid-price definitions are counted in a single pass
 
     Parameters
     ----------
 
     ob_data:dict (default:None) --> Required parameter
-        Input data from orderbook, it has to be a dict of data frames with the following structure:
+        Input data from orderbook, it can be an OrderBook (see data.py) or a dict of data frames with the following
+        structure:
 
         'timestamp': Principal key, correspond to the timestamp associated to each orderbook
         'bid_size': First column on each data frame, correspond to the bid volume associated to each bid price order
@@ -150,6 +640,14 @@ def apt_check_tob(ob_data:dict) -> dict:
         'ask': Third column of the data frame, correspond to the lowest price a seller is willing to sell
         'ask_size': Fourth column of the data frame, correspond to the ask volume associated to each ask price order
 
+    freq:str (default:'1min') --> Optional parameter
+        Size of the time buckets of the experiments as a pandas time offset ('1s', '10s', '5min', '1h', ...),
+        buckets are counted from the midnight of the first day
+
+    depth:int (default:None) --> Optional parameter
+        Number of levels in the imbalance and in the volumes of the weighted mid-prices (see depth_features). If
+        it's None, the imbalance uses all the levels and the weighted mid-price b only the first one
+
     Returns
     -------
 
@@ -167,95 +665,287 @@ def apt_check_tob(ob_data:dict) -> dict:
     References
     ----------
 
-    [1] https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.groupby.html
+    [1] https://numpy.org/doc/stable/reference/generated/numpy.bincount.html
     """
 
-    # -- General lambda functions definition -- #
-    calc_inbalace = lambda b, a, d: np.sum(b[:d]) / np.sum(np.add(b[:d], a[:d]))
-    w_mid = lambda b,bv,a,av,d: (bv[:d]/np.add(bv[:d],av[:d]))*a[:d]+(av[:d]/np.add(bv[:d],av[:d]))*b[:d]
-    apt_check = lambda df: sum(df['Simple Mid-Price'].shift() == df['Simple Mid-Price'])
-    apt_check_a = lambda df: sum(df['Weighted Mid-Price A'].shift() == df['Weighted Mid-Price A'])
-    apt_check_b = lambda df: sum(df['Weighted Mid-Price B'].shift() == df['Weighted Mid-Price B'])
+    # -- Top of the book prices (simple mid-price and both weighted mid-prices) -- #
+    ob_data = _as_orderbook(ob_data)
+    tob = top_of_book(ob_data)
+    weighted = tob if depth is None else depth_features(ob_data, depth)
+    prices = np.column_stack([tob['mid_price'], weighted['weighted_mid_a'], weighted['weighted_mid_b']])
 
-    # -- Data frame of analysis definition -- #
-    price_df = pd.DataFrame.from_dict({i: [(ob_data[i].iloc[0,:]['ask'] + ob_data[i].iloc[0,:]['bid'])*0.5,
+    # -- Grouping by freq (one pass for all the mid-prices) -- #
+    with profiling.stage('counts'):
+        apt_e1, apt_total, index = _bucket_counts(prices, tob['timestamps'], pd.Timedelta(freq).value)
+    profiling.count('snapshots', len(prices))
 
-                                       round((calc_inbalace(ob_data[i]['bid_size'],
-                                                            ob_data[i]['ask_size'],
-                       len(ob_data[i])))*((ob_data[i].iloc[0,:]['ask']+ob_data[i].iloc[0,:]['bid'])*0.5),2),
+    # -- Data frame with final results for each -- #
+    with profiling.stage('frames'):
+        r_data = _apt_tob_frames(apt_e1, apt_total, index)
 
-                                            round(w_mid(ob_data[i]['bid'], ob_data[i]['bid_size'],
-                                                   ob_data[i]['ask'], ob_data[i]['ask_size'],1)[0], 2)]
+    return r_data
 
-                                            for i in ob_data}).T
+### Function definition for several depths
+@profiling.timed('apt_check_depths')
+def apt_check_depths(ob_data:dict,
+                     depths:list=None,
+                     freq:str='1min') -> dict:
 
-    price_df.index = pd.to_datetime(pd.Series(price_df.index.values))
-    price_df.columns = ['Simple Mid-Price', 'Weighted Mid-Price A', 'Weighted Mid-Price B']
+    """
+    Test APT model function (top of the book) for several depths at once. The weighted mid-prices of every depth
+    are looked up in the cumulative volumes (see depth_profile) and all of them are counted in a single pass
 
-    # -- Grouping by 1 minute frequency -- #
-    # First data frame defined for simple mid-price
-    apt_mid_e1 = price_df.groupby(pd.Grouper(freq='1min')).apply(apt_check).tolist()
-    apt_mid_total = price_df.groupby(pd.Grouper(freq='1min')).count()['Simple Mid-Price']
-    apt_mid_e2 = (np.array(apt_mid_total) - np.array(apt_mid_e1)).tolist()
+    Parameters
+    ----------
 
-    # Second data frame defined for weighted mid-price a
-    apt_wmida_e1 = price_df.groupby(pd.Grouper(freq='1min')).apply(apt_check_a).tolist()
-    apt_wmida_e2 = (np.array(apt_mid_total) - np.array(apt_wmida_e1)).tolist()
+    ob_data:dict (default:None) --> Required parameter
+        Input data from orderbook, an OrderBook (see data.py) or a dict of data frames (timestamp --> orderbook),
+        see apt_check_tob
 
-    # Third data frame defined for weighted mid-price b
-    apt_wmidb_e1 = price_df.groupby(pd.Grouper(freq='1min')).apply(apt_check_b).tolist()
-    apt_wmidb_e2 = (np.array(apt_mid_total) - np.array(apt_wmidb_e1)).tolist()
+    depths:list (default:None) --> Optional parameter
+        Numbers of levels, from 1 to the largest orderbook depth if it's None
 
-    # -- Data frame with final results for each -- #
-    simple_mid = pd.DataFrame(columns=['Exp 1', 'Exp 2',
-                                       'P. Exp 1', 'P. Exp 2'])
-
-    weighted_mid_a = simple_mid.copy()
-    weighted_mid_b = simple_mid.copy()
-
-    simple_mid['Exp 1'] = apt_mid_e1
-    simple_mid['Exp 2'] = apt_mid_e2
-    simple_mid['P. Exp 1'] = list(np.round(np.array(apt_mid_e1) / np.array(apt_mid_total),2))
-    simple_mid['P. Exp 2'] = 1 - simple_mid['P. Exp 1']
-    simple_mid.index = apt_mid_total.index.values
-    simple_mid.index.name = 'Time'
-
-    weighted_mid_a['Exp 1'] = apt_wmida_e1
-    weighted_mid_a['Exp 2'] = apt_wmida_e2
-    weighted_mid_a['P. Exp 1'] = list(np.round(np.array(apt_wmida_e1) / np.array(apt_mid_total),2))
-    weighted_mid_a['P. Exp 2'] = 1 - weighted_mid_a['P. Exp 1']
-    weighted_mid_a.index = apt_mid_total.index.values
-    weighted_mid_a.index.name = 'Time'
-
-    weighted_mid_b['Exp 1'] = apt_wmidb_e1
-    weighted_mid_b['Exp 2'] = apt_wmidb_e2
-    weighted_mid_b['P. Exp 1'] = list(np.round(np.array(apt_wmidb_e1) / np.array(apt_mid_total),2))
-    weighted_mid_b['P. Exp 2'] = 1 - weighted_mid_b['P. Exp 1']
-    weighted_mid_b.index = apt_mid_total.index.values
-    weighted_mid_b.index.name = 'Time'
+    freq:str (default:'1min') --> Optional parameter
+        Size of the time buckets of the experiments as a pandas time offset
 
-    # -- Return data -- #
-    r_data = {'simple_mid_price': simple_mid, 'weighted_mid_price_a': weighted_mid_a,
-              'weighted_mid_price_b': weighted_mid_b}
+    Returns
+    -------
+
+    r_data: dict
+        Return data, it's a dict with the results of each depth (depth --> dict of data frames of apt_check_tob
+        with the same depth)
+
+    References
+    ----------
+
+    [1] https://numpy.org/doc/stable/reference/generated/numpy.bincount.html
+    """
+
+    ob_data = _as_orderbook(ob_data)
+    tob = top_of_book(ob_data)
+    depths = list(range(1, depth_profile(ob_data)['bid_size'].shape[1] + 1)) if depths is None else list(depths)
+
+    # -- Simple mid-price and both weighted mid-prices of each depth -- #
+    columns = [tob['mid_price']]
+    for depth in depths:
+        features = depth_features(ob_data, depth)
+        columns += [features['weighted_mid_a'], features['weighted_mid_b']]
+
+    # -- Grouping by freq (one pass for all the depths) -- #
+    with profiling.stage('counts'):
+        apt_e1, apt_total, index = _bucket_counts(np.column_stack(columns), tob['timestamps'], pd.Timedelta(freq).value)
+    profiling.count('snapshots', len(ob_data))
+
+    r_data = {depth: _apt_tob_frames(apt_e1[:, [0, 2*k + 1, 2*k + 2]], apt_total, index)
+              for k, depth in enumerate(depths)}
 
     return r_data
 
+### Function definition for several time resolutions
+@profiling.timed('apt_check_resolutions')
+def apt_check_resolutions(ob_data:dict,
+                          freqs:list=('1s', '10s', '1min', '5min', '1h'),
+                          orders:str='tob') -> dict:
+
+    """
+    Test APT model function for several bucket sizes at once. The orderbooks are counted a single time with the
+    smallest bucket, and each size is rolled up from the previous one with the counts, the number of observations
+    and the first and last prices of its buckets, so the raw data isn't scanned again for each resolution
+
+    Parameters
+    ----------
+
+    ob_data:dict (default:None) --> Required parameter
+        Input data from orderbook, an OrderBook (see data.py) or a dict of data frames (timestamp --> orderbook),
+        see apt_check_tob
+
+    freqs:list (default:('1s', '10s', '1min', '5min', '1h')) --> Optional parameter
+        Bucket sizes as pandas time offsets, from the smallest to the largest, each one a multiple of the previous
+
+    orders:str (default:'tob') --> Optional parameter
+        'tob' for the top of the book experiments (apt_check_tob) or 'all' for all the orders (apt_check_all)
+
+    Returns
+    -------
+
+    r_data: dict
+        Return data, it's a dict with the results of each bucket size (freq --> dict of data frames of
+        apt_check_tob or apt_check_all). The orderbooks are taken in time order, so with unsorted orderbooks the
+        'all' results can differ from apt_check_all, which keeps the order of appearance within each bucket
+
+    References
+    ----------
+
+    [1] https://numpy.org/doc/stable/reference/generated/numpy.ufunc.reduceat.html
+    """
+
+    steps = [pd.Timedelta(freq).value for freq in freqs]
+    for previous, step in zip(steps, steps[1:]):
+        if step <= previous or step % previous:
+            raise ValueError(f"Each bucket size must be a multiple of the previous one, got {list(freqs)}")
+
+    if orders not in ('tob', 'all'):
+        raise ValueError(f"orders must be 'tob' or 'all', got {orders!r}")
+
+    # -- Observations in time order (top of the book or all the orders) -- #
+    ob_data = _as_orderbook(ob_data)
+    if orders == 'tob':
+        tob = top_of_book(ob_data)
+        values = np.column_stack([tob['mid_price'], tob['weighted_mid_a'], tob['weighted_mid_b']])
+        timestamps = tob['timestamps']
+        order = np.argsort(timestamps, kind='stable')
+        values, timestamps = values[order], timestamps[order]
+    else:
+        if np.any(ob_data.timestamps[1:] < ob_data.timestamps[:-1]):
+            ob_data = ob_data.take(np.argsort(ob_data.timestamps, kind='stable'))
+        values = _order_prices(ob_data)
+        timestamps = np.repeat(ob_data.timestamps, ob_data.levels)
+
+    # -- Smallest buckets from the observations and the rest from the previous size -- #
+    origin = timestamps[0] - timestamps[0] % _DAY_NS
+    with profiling.stage('counts'):
+        summary = _bucket_summary(values, _bucket_starts(timestamps, steps[0], origin))
+    profiling.count('snapshots', len(ob_data))
+
+    r_data = {}
+    for freq, step in zip(freqs, steps):
+        if step != steps[0]:
+            summary = _rollup(summary, step, origin)
+        r_data[freq] = _summary_frames(summary, step, orders)
+
+    return r_data
+
+### Class definition for online APT experiments
+class OnlineAptCheck:
+
+    """
+    Online version of apt_check_all and apt_check_tob. Orderbooks are pushed one at a time (in time order) and
+    the Exp 1 / Exp 2 counts of the current minute are updated in O(levels), so the martingale statistics can be
+    followed live. Once all the orderbooks are pushed, the results are the same of the batch functions
+    """
+
+    def __init__(self):
+
+        self.minute = None # Current minute (int64 nanoseconds)
+
+        # All orders --> Exp 1 counts (simple and weighted mid-price), orders and mid-prices of the last order
+        self._all_exp_1 = np.zeros(2, dtype=np.int64)
+        self._all_orders = 0
+        self._all_last = None
+
+        # Top of the book --> Exp 1 counts (simple mid-price, weighted mid-price A and B), orderbooks and last prices
+        self._tob_exp_1 = np.zeros(3, dtype=np.int64)
+        self._tob_books = 0
+        self._tob_last = None
+
+        # Closed minutes
+        self._all_rows = []
+        self._tob_rows = []
+
+    def update(self, timestamp, bid_size, bid, ask, ask_size) -> bool:
+
+        """
+        Push a new orderbook (timestamp and its levels, best level first). It returns True when the orderbook
+        starts a new minute, that is, when the previous one was closed
+        """
+
+        timestamp = _timestamp_ns(timestamp)
+        minute = timestamp - timestamp % _MINUTE_NS
+        if self.minute is not None and minute < self.minute:
+            raise ValueError('Orderbooks have to be pushed in time order')
+
+        closed = self.minute is not None and minute > self.minute
+        if closed:
+            self._close(minute)
+        self.minute = minute
+
+        bid_size, bid = np.asarray(bid_size, dtype=np.float64), np.asarray(bid, dtype=np.float64)
+        ask, ask_size = np.asarray(ask, dtype=np.float64), np.asarray(ask_size, dtype=np.float64)
+
+        # -- All orders, each order against the previous one of the same minute -- #
+        mid_price = (bid + ask)*0.5
+        weighted_mid = np.round(_kernels['weighted_mid'](bid, bid_size, ask, ask_size), 2)
+        prices = np.column_stack([mid_price, weighted_mid])
+
+        self._all_exp_1 += np.count_nonzero(prices[1:] == prices[:-1], axis=0)
+        if self._all_last is not None:
+            self._all_exp_1 += self._all_last == prices[0]
+        self._all_orders += len(prices)
+        self._all_last = prices[-1]
+
+        # -- Top of the book, each orderbook against the previous one of the same minute -- #
+        imbalance = np.nansum(bid_size) / np.nansum(bid_size + ask_size)
+        tob_prices = np.array([mid_price[0], np.round(imbalance*mid_price[0], 2), weighted_mid[0]])
+
+        if self._tob_last is not None:
+            self._tob_exp_1 += self._tob_last == tob_prices
+        self._tob_books += 1
+        self._tob_last = tob_prices
+
+        return closed
+
+    def _close(self, next_minute:int):
+        self._all_rows.append((self.minute, self._all_exp_1, self._all_orders))
+        self._tob_rows.append((self.minute, self._tob_exp_1, self._tob_books))
+
+        # Minutes without orderbooks are empty buckets for the top of the book results (like pd.Grouper)
+        for minute in range(self.minute + _MINUTE_NS, next_minute, _MINUTE_NS):
+            self._tob_rows.append((minute, np.zeros(3, dtype=np.int64), 0))
+
+        self._all_exp_1, self._all_orders, self._all_last = np.zeros(2, dtype=np.int64), 0, None
+        self._tob_exp_1, self._tob_books, self._tob_last = np.zeros(3, dtype=np.int64), 0, None
+
+    def current(self) -> dict:
+
+        """
+        Partial result of the current minute, a dict with 'all' (apt_check_all frames) and 'tob' (apt_check_tob
+        frames) keys, each frame with a single row
+        """
+
+        return self._frames([], [], include_current=True)
+
+    def results(self, include_current:bool=True) -> dict:
+
+        """
+        Results of all the closed minutes (and the current one), in the same 'all' / 'tob' dict of current
+        """
+
+        return self._frames(self._all_rows, self._tob_rows, include_current)
+
+    def _frames(self, all_rows:list, tob_rows:list, include_current:bool) -> dict:
+        all_rows, tob_rows = list(all_rows), list(tob_rows)
+        if include_current and self.minute is not None:
+            all_rows.append((self.minute, self._all_exp_1, self._all_orders))
+            tob_rows.append((self.minute, self._tob_exp_1, self._tob_books))
+
+        all_times = np.array([row[0] for row in all_rows], dtype=np.int64)
+        tob_index = pd.DatetimeIndex(np.array([row[0] for row in tob_rows], dtype=np.int64).view('datetime64[ns]'))
+
+        return {'all': _apt_all_frames(all_times, np.array([row[1] for row in all_rows]).reshape(-1, 2),
+                                       np.array([row[2] for row in all_rows], dtype=np.int64)),
+                'tob': _apt_tob_frames(np.array([row[1] for row in tob_rows]).reshape(-1, 3),
+                                       np.array([row[2] for row in tob_rows], dtype=np.int64), tob_index)}
+
 # =================================== Roll model check function =========================================== #
 
 ### Function definition for Roll model validation
+@profiling.timed('roll_model_check')
 def roll_model_check(ob_data:dict,
-                     pt_data:pd.DataFrame) -> dict:
+                     pt_data:pd.DataFrame,
+                     sample:int=None,
+                     windows:list=None) -> dict:
 
     """
     Test Roll model function. It calculates theoretical spread in order to make a clear comparison between that
     value and the observed in real data, It also calculates the probability evolution in sell and buy orders to
-    check the assumption of independence between order type
+    check the assumption of independence between order type. The input data is never modified
 
     Parameters
     ----------
 
     ob_data:dict (default:None) --> Required parameter
-        Input data from orderbook, it has to be a dict of data frames with the following structure:
+        Input data from orderbook, it can be an OrderBook (see data.py) or a dict of data frames with the following
+        structure:
 
         'timestamp': Principal key, correspond to the timestamp associated to each orderbook
         'bid_size': First column on each data frame, correspond to the bid volume associated to each bid price order
@@ -271,6 +961,14 @@ def roll_model_check(ob_data:dict,
         'amount': Traded volume at a specific price and timestamp
         'side': Traded order direction (sell or buy)
 
+    sample:int (default:None) --> Optional parameter
+        Number of trades (from the start of pt_data) in the probability evolution, all of them if it's None
+
+    windows:list (default:None) --> Optional parameter
+        Time windows for rolling estimates, as pandas time offsets (for example ['5min', '1h']). Each window adds a
+        theoretical_spread_<window> column to the spread definition and a column to rolling_auto_correlation, the
+        orderbooks and the trades must be sorted by time (ValueError otherwise)
+
     Returns
     -------
 
@@ -279,8 +977,8 @@ def roll_model_check(ob_data:dict,
 
         'spread_definition': Data frame with the calculations of theoretical spread, bid and ask
 
-        'prob_evolution': Data frame with the probability evolution on sell and buy orders. Just a
-                          sample of 10,000 because time complexity computation
+        'prob_evolution': Data frame with the probability evolution on sell and buy orders, for the whole
+                          public trades data or the first sample trades
 
         'auto_correlation': Auto correlation between orders (buy and sell)
 
@@ -288,62 +986,161 @@ def roll_model_check(ob_data:dict,
 
         'total_buy_prob': Frequency probability of total orders of buy
 
+        'rolling_auto_correlation': Data frame with the auto correlation between orders over each time window,
+                                    indexed by trade timestamp (only when windows are given)
+
     References
     ----------
 
     [1] https://www.statsmodels.org/dev/_modules/statsmodels/tsa/stattools.html
     """
 
-    # -- Generalized lambda functions -- #
-    prob_evo = lambda series,end,counter: round(list(series[0:end]).count(counter) / len(series[0:end]), 4)
-
     # -- Data frame definition -- #
-    roll_df = pd.DataFrame.from_dict({i: (ob_data[i]['bid_size'].iloc[0], ob_data[i]['bid'].iloc[0],
-                                          ob_data[i]['ask'].iloc[0], ob_data[i]['ask_size'].iloc[0],
-                                          (ob_data[i].iloc[0]['bid'] + ob_data[i].iloc[0]['ask'])*0.5)
-                                      for i in ob_data}).T
-
-    roll_df.index = pd.to_datetime(roll_df.index.values)
+    tob = top_of_book(ob_data)
+    roll_df = pd.DataFrame({column: tob[column] for column in ['bid_size', 'bid', 'ask', 'ask_size', 'mid_price']},
+                           index=pd.DatetimeIndex(tob['timestamps'].view('datetime64[ns]')).tz_localize('UTC'))
     roll_df.index.name = 'Time'
-    roll_df.columns = ['bid_size', 'bid', 'ask', 'ask_size', 'mid_price']
 
     # -- Differences between prices -- #
-    diff_prices = [roll_df['mid_price'][i+1] - roll_df['mid_price'][i] for i in range(len(roll_df)-1)]
+    diff_prices = np.diff(tob['mid_price'])
 
     # -- Theoretical spread calculation -- #
-    # Model spread definition --> Spread = 2*C: C = sqrt(-gamma_1): gamma_1 = Cov(delta(p_t-1)*delta(p_t))
-    # First let's define a generalized spread for all orderbook data
-    ob_teo_spread = round(np.sqrt(np.abs(acovf(np.array(diff_prices), adjusted=True, nlag=1)[1]))*2, 6)
-
-    # Now let's describe the evolution of that theoretical spread
-    teo_spread = [np.sqrt(np.abs(acovf(np.array(diff_prices[0:i]), adjusted=True, nlag=1)[1]))*2
-                  for i in range(2, len(diff_prices)+1)]
+    with profiling.stage('spread'):
+        # Model spread definition --> Spread = 2*C: C = sqrt(-gamma_1): gamma_1 = Cov(delta(p_t-1)*delta(p_t))
+        # First let's define a generalized spread for all orderbook data
+        ob_teo_spread = round(np.sqrt(np.abs(acovf(diff_prices, adjusted=True, nlag=1)[1]))*2, 6)
+
+        # Now let's describe the evolution of that theoretical spread (expanding window, with running sums)
+        teo_spread = np.zeros(len(roll_df)) # Zeros for the first two because of time lags
+        teo_spread[2:] = np.sqrt(np.abs(_lag1_autocovariance(diff_prices)[1:]))*2
+
+        # Rolling theoretical spread, each price change belongs to the time of the second orderbook
+        rolling_spread = {}
+        for window in windows or []:
+            starts = _window_starts(tob['timestamps'][1:], window)
+            rolling_spread[window] = np.zeros(len(roll_df)) # Zeros when there isn't a lag in the window
+            rolling_cov = _lag1_autocovariance(diff_prices, starts)
+            rolling_spread[window][1:] = np.where(np.isnan(rolling_cov), 0.0, np.sqrt(np.abs(rolling_cov))*2)
 
     # -- Data frame consolidation for theoretical and real spread -- #
     roll_df['real_spread'] = roll_df['ask'] - roll_df['bid']
-    roll_df['theoretical_spread'] = [0.0, 0.0] + teo_spread # Add zeros because of time lags
+    roll_df['theoretical_spread'] = teo_spread
     roll_df['spread_diff'] = roll_df['real_spread'] - roll_df['theoretical_spread']
     roll_df['theoretical_bid'] = roll_df['mid_price'] - ob_teo_spread
     roll_df['theoretical_ask'] = roll_df['mid_price'] + ob_teo_spread
+    for window, values in rolling_spread.items():
+        roll_df[f'theoretical_spread_{window}'] = values
 
     # -- Data frame definition for probability of buy or sell -- #
-    sell_evo = [prob_evo(pt_data.side, i, "sell") for i in range(1,10001)] # 10000 scenarios
-    buy_evo = list((1-np.array(sell_evo)))
+    with profiling.stage('prob_evolution'):
+        # Cumulative frequency of sell orders over the first n_trades trades
+        sell = (pt_data['side'] == "sell").to_numpy()
+        n_trades = len(sell) if sample is None else min(sample, len(sell))
+
+        sell_evo = _round_ratio(np.cumsum(sell[:n_trades]), np.arange(1, n_trades+1), 4)
+        buy_evo = 1 - sell_evo
 
-    pt_data_sample = pt_data[0:10000]
-    pt_data_sample['prob_sell'] = sell_evo
-    pt_data_sample['prob_buy'] = buy_evo
-    pt_data_sample['timestamp'] = pd.to_datetime(pt_data_sample['timestamp'])
+        # Trade timestamps parsed once (the sample, or the whole tape for the rolling windows)
+        trade_times = pd.to_datetime(pt_data['timestamp'] if windows else pt_data['timestamp'].iloc[0:n_trades])
+
+        # New data frame for the sample (pt_data is never modified)
+        pt_data_sample = pt_data.iloc[0:n_trades]
+        pt_data_sample = pd.DataFrame({**{column: pt_data_sample[column] for column in pt_data_sample.columns},
+                                       'timestamp': trade_times.iloc[0:n_trades],
+                                       'prob_sell': sell_evo, 'prob_buy': buy_evo})
 
     # -- Auto correlation and final probability within the whole time series
-    pt_data['direction'] = [-1 if i=="sell" else 1 for i in pt_data.side]
-    auto_corr = acf(np.array(pt_data['direction']), nlags=1)[1]
-    total_sell_prob = prob_evo(pt_data.side, len(pt_data), "sell")
-    total_buy_prob = prob_evo(pt_data.side, len(pt_data), "buy")
+    with profiling.stage('auto_correlation'):
+        direction = np.where(sell, -1, 1)
+        auto_corr = acf(direction, nlags=1)[1]
+        # Python integers, so the ratios are rounded by python round (not by the numpy one)
+        total_sell_prob = round(int(np.count_nonzero(sell)) / len(sell), 4)
+        total_buy_prob = round(int(np.count_nonzero((pt_data['side'] == "buy").to_numpy())) / len(sell), 4)
+
+        # -- Rolling auto correlation within each time window -- #
+        if windows:
+            trade_ns = trade_times.values.astype('datetime64[ns]').view(np.int64)
+            rolling_corr = pd.DataFrame({window: _lag1_autocorrelation(direction, _window_starts(trade_ns, window))
+                                         for window in windows},
+                                        index=pd.DatetimeIndex(trade_times, name='timestamp'))
+
+    profiling.count('snapshots', len(roll_df))
+    profiling.count('trades', len(sell))
 
     # -- Return data -- #
     r_data = {'spread_definition': roll_df, 'prob_evolution': pt_data_sample,
               'auto_correlation': auto_corr, 'total_sell_prob': total_sell_prob,
               'total_buy_prob': total_buy_prob}
 
-    return r_data
\ No newline at end of file
+    if windows:
+        r_data['rolling_auto_correlation'] = rolling_corr
+
+    return r_data
+
+### Class definition for online Roll model
+class OnlineRoll:
+
+    """
+    Online version of roll_model_check. Top of the book orderbooks and trades are pushed one at a time and the
+    theoretical spread, bid and ask, the lag 1 autocorrelation of the order direction and the sell and buy
+    frequencies are kept up to date with running moments, in constant time and memory for each update
+
+    References
+    ----------
+
+    [1] https://www.statsmodels.org/dev/_modules/statsmodels/tsa/stattools.html
+    """
+
+    def __init__(self):
+
+        self.time = None
+        self.bid = self.ask = self.mid_price = np.nan
+
+        self._diff_prices = _LagOneMoments() # Mid-price changes
+        self._direction = _LagOneMoments() # -1 for sell orders and 1 for buy orders
+        self._sells = self._buys = 0
+
+    def update_book(self, timestamp, bid:float, ask:float) -> dict:
+
+        """ Push the best bid and ask of a new orderbook, it returns the updated state (see state) """
+
+        mid_price = (float(bid) + float(ask))*0.5
+        if not np.isnan(self.mid_price):
+            self._diff_prices.push(mid_price - self.mid_price)
+
+        self.time, self.bid, self.ask, self.mid_price = timestamp, float(bid), float(ask), mid_price
+
+        return self.state()
+
+    def update_trade(self, side:str) -> dict:
+
+        """ Push the side ('sell' or 'buy') of a new trade, it returns the updated state (see state) """
+
+        self._sells += int(side == "sell") # Python integers, the frequencies are rounded by python round
+        self._buys += int(side == "buy")
+        self._direction.push(-1.0 if side == "sell" else 1.0)
+
+        return self.state()
+
+    def state(self) -> dict:
+
+        """
+        Current state of the model, it's a dict with the following structure:
+
+        'time', 'bid', 'ask', 'mid_price': Last orderbook pushed
+        'real_spread': Observed spread of the last orderbook
+        'theoretical_spread': Roll spread with all the mid-price changes so far (0 for the first two orderbooks)
+        'theoretical_bid', 'theoretical_ask': Mid-price minus / plus the theoretical spread
+        'auto_correlation': Lag 1 autocorrelation of the order direction
+        'total_sell_prob', 'total_buy_prob': Frequency of sell and buy orders
+        """
+
+        teo_spread = np.sqrt(np.abs(self._diff_prices.autocovariance()))*2 if self._diff_prices.n > 1 else 0.0
+        trades = self._direction.n
+
+        return {'time': self.time, 'bid': self.bid, 'ask': self.ask, 'mid_price': self.mid_price,
+                'real_spread': self.ask - self.bid, 'theoretical_spread': teo_spread,
+                'theoretical_bid': self.mid_price - teo_spread, 'theoretical_ask': self.mid_price + teo_spread,
+                'auto_correlation': self._direction.autocorrelation(),
+                'total_sell_prob': round(self._sells / trades, 4) if trades else np.nan,
+                'total_buy_prob': round(self._buys / trades, 4) if trades else np.nan}
@@ -0,0 +1,121 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- kernels.py : It's a python script with the numeric kernels of the models (numpy and numba)          -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import numpy as np
+
+# Numba is optional, without it only the numpy kernels are available
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# ======================================== NumPy kernels ================================================== #
+
+### Weighted mid-price of each level
+def _weighted_mid_numpy(bid:np.ndarray, bid_size:np.ndarray, ask:np.ndarray, ask_size:np.ndarray) -> np.ndarray:
+    return (bid_size/np.add(bid_size, ask_size))*ask + (ask_size/np.add(bid_size, ask_size))*bid
+
+### Exp 1 counts, rows equal to the previous one of the same bucket (values is a (rows, prices) array)
+def _equal_counts_numpy(values:np.ndarray, codes:np.ndarray, n_buckets:int) -> np.ndarray:
+    n_prices = values.shape[1]
+    equal = (codes[1:] == codes[:-1])[:, None] & (values[1:] == values[:-1])
+    pair_codes = codes[1:, None]*n_prices + np.arange(n_prices)
+
+    return np.bincount(pair_codes[equal], minlength=n_buckets*n_prices).reshape(n_buckets, n_prices)
+
+### Centered lag 1 moments of the windows x[starts[i]:i+1] (window size, cross products and squares)
+def _lag1_moments_numpy(x:np.ndarray, starts:np.ndarray) -> tuple:
+    x = x - x.mean() if len(x) else x
+    ends = np.arange(len(x))
+
+    # Running sums, sums[k] = x_0 + ... + x_k-1 and pairs[k] = x_1*x_0 + ... + x_k-1*x_k-2
+    sums = np.concatenate([[0.0], np.cumsum(x)])
+    squares = np.concatenate([[0.0], np.cumsum(x**2)])
+    pairs = np.concatenate([[0.0, 0.0], np.cumsum(x[1:]*x[:-1])])[:len(x)+1]
+
+    n = ends - starts + 1
+    window_sum = sums[ends+1] - sums[starts]
+    mean = window_sum / n
+
+    # sum (x_t - mean)(x_t-1 - mean) and sum (x_t - mean)^2 over the window
+    cross = (pairs[ends+1] - pairs[starts+1]) - mean*(2*window_sum - x[starts] - x[ends]) + (n - 1)*mean**2
+    centered_squares = (squares[ends+1] - squares[starts]) - window_sum*mean
+
+    return n, cross, centered_squares
+
+# ======================================== Numba kernels ================================================== #
+
+if numba is not None:
+
+    ### Weighted mid-price of each level
+    @numba.njit(cache=True, error_model='numpy')
+    def _weighted_mid_numba(bid, bid_size, ask, ask_size):
+        r_data = np.empty(len(bid))
+        for i in range(len(bid)):
+            total = bid_size[i] + ask_size[i]
+            r_data[i] = (bid_size[i]/total)*ask[i] + (ask_size[i]/total)*bid[i]
+
+        return r_data
+
+    ### Exp 1 counts, rows equal to the previous one of the same bucket
+    @numba.njit(cache=True, error_model='numpy')
+    def _equal_counts_numba(values, codes, n_buckets):
+        r_data = np.zeros((n_buckets, values.shape[1]), dtype=np.int64)
+        for i in range(1, len(codes)):
+            if codes[i] == codes[i-1]:
+                for j in range(values.shape[1]):
+                    if values[i, j] == values[i-1, j]:
+                        r_data[codes[i], j] += 1
+
+        return r_data
+
+    ### Centered lag 1 moments of the windows x[starts[i]:i+1]
+    @numba.njit(cache=True, error_model='numpy')
+    def _lag1_moments_numba(x, starts):
+        size = len(x)
+        mean = x.mean() if size else 0.0
+
+        # Running sums (the same definition of the numpy kernel)
+        sums = np.zeros(size + 1)
+        squares = np.zeros(size + 1)
+        pairs = np.zeros(size + 1)
+        for i in range(size):
+            value = x[i] - mean
+            sums[i+1] = sums[i] + value
+            squares[i+1] = squares[i] + value*value
+            if i > 0:
+                pairs[i+1] = pairs[i] + value*(x[i-1] - mean)
+
+        n = np.empty(size, dtype=np.int64)
+        cross = np.empty(size)
+        centered_squares = np.empty(size)
+        for i in range(size):
+            start = starts[i]
+            n[i] = i - start + 1
+            window_sum = sums[i+1] - sums[start]
+            window_mean = window_sum / n[i]
+            cross[i] = ((pairs[i+1] - pairs[start+1]) - window_mean*(2*window_sum - (x[start] - mean) - (x[i] - mean))
+                        + (n[i] - 1)*window_mean**2)
+            centered_squares[i] = (squares[i+1] - squares[start]) - window_sum*window_mean
+
+        return n, cross, centered_squares
+
+# ======================================== Backends ======================================================= #
+
+### Kernels of each available backend (backend name --> kernel name --> function)
+BACKENDS = {'numpy': {'weighted_mid': _weighted_mid_numpy, 'equal_counts': _equal_counts_numpy,
+                      'lag1_moments': _lag1_moments_numpy}}
+
+if numba is not None:
+    BACKENDS['numba'] = {'weighted_mid': _weighted_mid_numba, 'equal_counts': _equal_counts_numba,
+                         'lag1_moments': _lag1_moments_numba}
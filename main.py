@@ -11,144 +11,165 @@
 
 # =================================== Required packages and scripts ======================================= #
 # Required packages
-import pandas as pd
-import numpy as np
+import argparse
+import os
+import pickle
+import sys
+import time
 import warnings
 
-# Required local scripts
+# Required local scripts (visualizations, and so plotly, is only imported when charts are requested)
 import data as dt
-import functions as fn
-import visualizations as vz
-
-# ======================================== Data description =============================================== #
-
-# -- For OrderBook data -- #
-# Let's visualize the keys range.
-ob_data = dt.ob_data_bit
-range_ob = pd.to_datetime(pd.Series(list(ob_data.keys()))).sort_values()
-print(f'El primer tiempo registrado está en: {range_ob[0]}, y el último en: {range_ob.tail(1).item()}')
-
-# Let's see how many books do we have
-print(f'En una hora de tiempo contamos con {len(list(ob_data.keys())):,} libros')
-
-# Let's see the first orderbook values
-print(f'Este primer orderbook corresponde al punto en el tiempo. {range_ob[0]}:')
-list(ob_data.values())[0].head(5)
-
-# -- For PublicTrades data -- #
-# Let's visualize the df range.
-pt_data = dt.pt_data
-range_pt = pd.to_datetime(pt_data.timestamp).sort_values()
-print(f'''El primer tiempo registrado está en: 
-{range_pt.head(1).item()}, y el último en: {range_pt.tail(1).item()}''')
-
-# Let's see the public trades dataframe
-print(f'Los public trades con los que contamos tienen un total de {pt_data.shape[0]:,} filas')
-pt_data.head()
-
-# ======================================== APT model testing ============================================== #
+import runner
 
-# -- Run functions -- #
-apt_all = fn.apt_check_all(ob_data)
-apt_tob = fn.apt_check_tob(ob_data)
+# ====================================== Command line options ============================================= #
 
-print(f'The keys for apt model test with all orders are: {list(apt_all.keys())}')
-print(f'The keys for apt model test with tob orders are: {list(apt_tob.keys())}')
+### Function definition for the command line options
+def parse_args(argv:list=None) -> argparse.Namespace:
 
-# -- Test all orders contained -- #
-# Let's see the data frame for simple mid-price test
-print(f'''The min proportion where the mid-price follows martingale process is: 
-{apt_all['simple_mid_price']['P. Exp 1'].min()}
-and it happened on {apt_all['simple_mid_price']['P. Exp 1'].idxmin()}''')
-print("")
-print(f'''The mean proportion where the mid-price follows martingale process is:
-{round(apt_all['simple_mid_price']['P. Exp 1'].mean(),4)*100}%''')
+    """
+    Command line options of the batch run (python main.py --help)
 
-apt_all['simple_mid_price'].head()
+    Parameters
+    ----------
 
-# Let's see the data frame for weighted mid-price test
-print(f'''The max proportion where the mid-price follows martingale process is:
-{apt_all['weighted_mid_price']['P. Exp 1'].max()}
-and it happened on {apt_all['weighted_mid_price']['P. Exp 1'].idxmax()}''')
-print("")
-print(f'''The mean proportion where the mid-price follows martingale process is:
-{round(apt_all['weighted_mid_price']['P. Exp 1'].mean(),4)*100}%''')
+    argv: list (default:None) --> Optional parameter
+        Command line arguments, sys.argv[1:] if it's None
 
-apt_all['weighted_mid_price'].head()
+    Returns
+    -------
 
-# -- Test top of the book orders -- #
-# Now let's render the simple mid-price experiment just for tob
-print(f'''The min proportion where the mid-price follows martingale process is:
-{apt_tob['simple_mid_price']['P. Exp 1'].min()}
-and it happened on {apt_tob['simple_mid_price']['P. Exp 1'].idxmin()}''')
-print("")
-print(f'''The mean proportion where the mid-price follows martingale process is:
-{round(apt_tob['simple_mid_price']['P. Exp 1'].mean(),4)*100}%''')
+    args: argparse.Namespace
+        Parsed options
+    """
 
-apt_tob['simple_mid_price'].head()
+    parser = argparse.ArgumentParser(description='APT and Roll model tests over orderbooks and public trades')
 
-# Let's see the mean proportion for experiment 1.
-print(f'''With all orders we have a mean proportion of:
-{round(apt_all['simple_mid_price']['P. Exp 1'].mean(),4)*100}%''')
-print(f'''With tob orders we have a mean proportion of:
-{round(apt_tob['simple_mid_price']['P. Exp 1'].mean(),4)*100}%''')
+    # -- Input data -- #
+    parser.add_argument('--orderbooks', default=dt.OB_PATH, help='Orderbooks json file (default: %(default)s)')
+    parser.add_argument('--trades', default=dt.PT_PATH, help='Public trades csv file (default: %(default)s)')
+    parser.add_argument('--exchanges', nargs='+', default=['bitfinex'], help='Exchanges of the orderbooks file')
+    parser.add_argument('--start', default=None, help='First timestamp to analyse (inclusive, UTC)')
+    parser.add_argument('--end', default=None, help='Last timestamp to analyse (exclusive, UTC)')
+    parser.add_argument('--no-cache', action='store_true', help="Parse the source files, don't use the binary cache")
 
-# Let's see now the tob experiments for the first way of calculation of weighted mid-price (A)
-print(f'''The min proportion where mid-price follows martingale process is:
-{apt_tob['weighted_mid_price_a']['P. Exp 1'].min()}
-and it happened on {apt_tob['weighted_mid_price_a']['P. Exp 1'].idxmin()}''')
-print("")
-print(f'''The mean proportion where the mid-price follows martingale process is:
-{round(apt_tob['weighted_mid_price_a']['P. Exp 1'].mean(),4)*100}%''')
+    # -- Analyses and their parameters -- #
+    parser.add_argument('--analyses', nargs='+', default=list(runner.ANALYSES), choices=list(runner.ANALYSES))
+    parser.add_argument('--freq', default=None, help="Bucket size of the APT experiments (default: '1min')")
+    parser.add_argument('--depth', type=int, default=None, help='Levels of each orderbook in the APT experiments')
+    parser.add_argument('--windows', nargs='+', default=None, help="Rolling windows of the Roll model ('5min' ...)")
 
-apt_tob['weighted_mid_price_a'].head()
+    # -- Execution and output -- #
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--whole', action='store_true', help='A single task for each exchange instead of one a day')
+    parser.add_argument('--no-results-cache', action='store_true',
+                        help="Run every analysis again, don't reuse the results of the previous runs")
+    parser.add_argument('--output', default='files/results.pkl', help='Results pickle file (default: %(default)s)')
+    parser.add_argument('--charts', default=None, help='Folder for the html charts, no charts (nor plotly) if unset')
+    parser.add_argument('--quiet', action='store_true', help="Don't print the summary of the results")
+
+    return parser.parse_args(argv)
 
-# Now let's compare it with the alternative way of calculating weighted mid-price (B)
-print(f'''The min proportion where mid-price follows martingale process is:
-{apt_tob['weighted_mid_price_b']['P. Exp 1'].min()}
-and it happened on {apt_tob['weighted_mid_price_b']['P. Exp 1'].idxmin()}''')
-print("")
-print(f'''The mean proportion where the mid-price follows martingale process is:
-{round(apt_tob['weighted_mid_price_b']['P. Exp 1'].mean(),4)*100}%''')
+### Extra arguments of each analysis from the command line options
+def _analysis_params(args:argparse.Namespace) -> dict:
+    apt_params = {name: value for name, value in [('freq', args.freq), ('depth', args.depth)] if value is not None}
+    roll_params = {'windows': args.windows} if args.windows else {}
 
-apt_tob['weighted_mid_price_b'].head()
+    return {'apt_all': apt_params, 'apt_tob': apt_params, 'roll': roll_params}
 
-# ======================================== Roll model testing ============================================= #
-
-# -- Run functions -- #
-warnings.filterwarnings("ignore")
-pt_data = dt.pt_data
-roll_model = fn.roll_model_check(ob_data, pt_data)
-print(f'The keys for roll model testing functions are: {roll_model.keys()}')
+# ======================================== Results output ================================================= #
 
+### Function definition for the summary of the results
+def print_summary(r_data:dict):
 
-# =================================== Results and visual resources ======================================== #
-
-# -- APT model charts -- #
-# Let's see how stands the proportion of times where the price follows a martingale process (all orders)
-vz.plot_stacked_bar(apt_all['simple_mid_price'], minutes=30)
+    """ One line for each exchange, period and analysis with its main statistic """
 
-# Let's see how stands the proportion of times where the price follows a martingale process (tob orders)
-vz.plot_stacked_bar(apt_tob['simple_mid_price'], minutes=30)
+    for exchange, periods in r_data.items():
+        for period, analyses in periods.items():
+            for name, result in analyses.items():
+                if name == 'roll':
+                    summary = (f"auto correlation {result['auto_correlation']:.4f}, "
+                               f"sell probability {result['total_sell_prob']:.4f}")
+                else:
+                    summary = f"mean P. Exp 1 (simple mid-price) {result['simple_mid_price']['P. Exp 1'].mean():.4f}"
+                print(f'{exchange:<10}{period:<12}{name:<9}{summary}')
 
-# -- Roll model charts -- #
-# Let's see how theoretical spread stands againts real observed spread
-vz.plot_teo_spread(roll_model['spread_definition'])['spread']
+### Function definition for the html charts
+def write_charts(r_data:dict,
+                 folder:str):
 
-# Let's see how is the difference between spreads (theoretical vs observed)
-vz.plot_teo_spread(roll_model['spread_definition'])['diff']
+    """ Html charts of each exchange, period and analysis (plotly is imported here and only here) """
 
-# Let's see how all of our theoretical metrics are defined
-vz.plot_teo_spread(roll_model['spread_definition'])['theo']
+    import visualizations as vz
 
-# Let's see how the bid value behave
-vz.plot_teo_spread(roll_model['spread_definition'])['bid']
+    os.makedirs(folder, exist_ok=True)
+    for exchange, periods in r_data.items():
+        for period, analyses in periods.items():
+            figures = {}
+            for name in ['apt_all', 'apt_tob']:
+                if name in analyses:
+                    figures[name] = vz.plot_stacked_bar(analyses[name]['simple_mid_price'], minutes=30)
+            if 'roll' in analyses:
+                figures.update({f'roll_{key}': fig
+                                for key, fig in vz.plot_teo_spread(analyses['roll']['spread_definition']).items()})
+                figures['roll_prob_evo'] = vz.plot_prob_evo(analyses['roll']['prob_evolution'])
 
-# Let's see how the ask value behave
-vz.plot_teo_spread(roll_model['spread_definition'])['ask']
+            for name, fig in figures.items():
+                fig.write_html(os.path.join(folder, f'{exchange}_{period}_{name}.html'), include_plotlyjs='cdn')
 
-# Let's see how all of our real observed metrics are defined
-vz.plot_teo_spread(roll_model['spread_definition'])['real']
+# ========================================== Entry point ================================================== #
 
-# Let's see the probability evolution within orders type
-vz.plot_prob_evo(roll_model['prob_evolution'])
+### Function definition for the batch run
+def main(argv:list=None) -> dict:
+
+    """
+    Batch run: loads the orderbooks of the requested exchanges and time range (and the public trades only if the
+    Roll model is requested), runs the analyses in parallel (see runner.run_analyses) and writes the results as a
+    pickle file with the structure exchange --> day --> analysis --> result. The results of the previous runs with
+    the same data and parameters are reused (see cache.py)
+
+    Parameters
+    ----------
+
+    argv: list (default:None) --> Optional parameter
+        Command line arguments, sys.argv[1:] if it's None
+
+    Returns
+    -------
+
+    r_data: dict
+        Return data, the results written in the output file
+    """
+
+    args = parse_args(argv)
+    warnings.filterwarnings("ignore")
+    started = time.perf_counter()
+
+    # -- Data loading (only what the analyses need) -- #
+    ob_data = {exchange: dt.load_orderbooks(exchange, args.start, args.end, args.orderbooks, not args.no_cache)
+               for exchange in args.exchanges}
+    pt_data = None
+    if 'roll' in args.analyses:
+        pt_data = dt.load_public_trades(args.start, args.end, args.trades, not args.no_cache)
+
+    # -- Analyses (results are reused while the data doesn't change, see cache.py) -- #
+    r_data = runner.run_analyses(ob_data, pt_data, args.analyses, by_day=not args.whole, max_workers=args.workers,
+                                 params=_analysis_params(args), cache=not args.no_results_cache)
+
+    # -- Output -- #
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'wb') as file:
+        pickle.dump(r_data, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    if args.charts is not None:
+        write_charts(r_data, args.charts)
+
+    if not args.quiet:
+        print_summary(r_data)
+        print(f'Results written in {args.output} ({time.perf_counter() - started:.2f}s)')
+
+    return r_data
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
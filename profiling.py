@@ -0,0 +1,261 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- profiling.py : It's a python script with timing, counters and memory instrumentation of the runs    -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import os
+import json
+import time
+import atexit
+import datetime
+import functools
+import contextlib
+import tracemalloc
+
+# Process memory is only available on unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# ====================================== Profiler definition ============================================== #
+
+### Class definition
+class Profiler:
+
+    """
+    Collector of the stage timers, counters and peak memory of a run. Stages can be nested and they are reported
+    with their full path (for example 'roll_model_check/spread'), calls of the same stage are accumulated.
+    Counters are reported under the path of the stage where they are counted, and the reports of worker processes
+    can be merged into the one of the run (see merge)
+
+    Parameters
+    ----------
+
+    memory: bool (default:False) --> Optional parameter
+        Trace the python allocations (tracemalloc) to report the peak of the traced memory during each stage, it
+        slows down the run
+    """
+
+    def __init__(self, memory:bool=False):
+
+        self.memory = memory
+        self.stages = {}
+        self.counters = {}
+        self.workers = {}
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self._start = time.perf_counter()
+        self._stack = [] # [path, start time, peak of its finished children] of the open stages
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def enter(self, name:str):
+        path = f'{self._stack[-1][0]}/{name}' if self._stack else name
+        if self.memory and tracemalloc.is_tracing():
+            if self._stack:
+                self._stack[-1][2] = max(self._stack[-1][2], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._stack.append([path, time.perf_counter(), 0])
+
+    def exit(self):
+        path, start, peak = self._stack.pop()
+        stage = self.stages.setdefault(path, {'calls': 0, 'seconds': 0.0})
+        stage['calls'] += 1
+        stage['seconds'] += time.perf_counter() - start
+
+        # Peak of the stage (its own allocations and the ones of its children), passed on to the parent stage
+        if self.memory and tracemalloc.is_tracing():
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            stage['peak_mb'] = max(stage.get('peak_mb', 0.0), peak / 2**20)
+            if self._stack:
+                self._stack[-1][2] = max(self._stack[-1][2], peak)
+            tracemalloc.reset_peak()
+
+    def count(self, name:str, value:int=1):
+        path = f'{self._stack[-1][0]}/{name}' if self._stack else name
+        self.counters[path] = self.counters.get(path, 0) + int(value)
+
+    def merge(self, report:dict):
+
+        """ Add the stages and counters of another report (a task of a worker process) under the current stage """
+
+        prefix = f'{self._stack[-1][0]}/' if self._stack else ''
+        for path, other in report['stages'].items():
+            stage = self.stages.setdefault(prefix + path, {'calls': 0, 'seconds': 0.0})
+            stage['calls'] += other['calls']
+            stage['seconds'] += other['seconds']
+            if 'peak_mb' in other:
+                stage['peak_mb'] = max(stage.get('peak_mb', 0.0), other['peak_mb'])
+
+        for path, value in report['counters'].items():
+            self.counters[prefix + path] = self.counters.get(prefix + path, 0) + value
+
+        # Tasks, time and memory of each worker process
+        worker = self.workers.setdefault(str(report['pid']), {'tasks': 0, 'seconds': 0.0})
+        worker['tasks'] += 1
+        worker['seconds'] += report['seconds']
+        if 'max_rss_mb' in report:
+            worker['max_rss_mb'] = max(worker.get('max_rss_mb', 0.0), report['max_rss_mb'])
+
+    def report(self) -> dict:
+
+        """ Structured report of the run (json serializable) """
+
+        r_data = {'pid': os.getpid(), 'started': self.started.isoformat(),
+                  'seconds': time.perf_counter() - self._start,
+                  'stages': self.stages, 'counters': self.counters}
+
+        if self.workers:
+            r_data['workers'] = self.workers
+
+        if resource is not None:
+            # ru_maxrss is in kilobytes on linux (bytes on macOS)
+            r_data['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+        return r_data
+
+    def write(self, path:str):
+
+        """ Write the report into a json file """
+
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+### Timer of one stage of the active profiler
+class _Stage:
+
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler:Profiler, name:str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.enter(self.name)
+
+    def __exit__(self, *exc_info):
+        self.profiler.exit()
+
+# ===================================== Instrumentation hooks ============================================= #
+
+### Active profiler, None when the instrumentation is off
+_active = None
+
+### Reused context of the stages when the instrumentation is off
+_NO_STAGE = contextlib.nullcontext()
+
+### Function definition for stage timers
+def stage(name:str):
+
+    """
+    Context manager that times a named stage of the active profiler, it does nothing when there isn't one
+
+    Parameters
+    ----------
+
+    name: str (default:None) --> Required parameter
+        Name of the stage, nested stages are reported as 'parent/name'
+    """
+
+    return _NO_STAGE if _active is None else _Stage(_active, name)
+
+### Function definition for counters
+def count(name:str,
+          value:int=1):
+
+    """ Add value to the named counter of the active profiler (rows, snapshots, trades...) """
+
+    if _active is not None:
+        _active.count(name, value)
+
+### Function definition for the active profiler
+def active():
+
+    """ Active profiler, None when the instrumentation is off """
+
+    return _active
+
+### Function definition for the reports of worker processes
+def merge(report:dict):
+
+    """ Merge the report of a worker process into the active profiler (see Profiler.merge) """
+
+    if _active is not None and report is not None:
+        _active.merge(report)
+
+### Function definition for function timers
+def timed(name:str):
+
+    """ Decorator that runs the whole function as a stage (see stage) """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with _Stage(_active, name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+### Function definition for profiled runs
+@contextlib.contextmanager
+def profile(path:str=None,
+            memory:bool=False):
+
+    """
+    Context manager that turns the instrumentation on for its block. The instrumentation can also be turned on
+    for a whole run with the APT_PROFILE environment variable (path of the report), and APT_PROFILE_MEMORY=1 to
+    trace the memory
+
+    Parameters
+    ----------
+
+    path: str (default:None) --> Optional parameter
+        Path of the json report written at the end of the block, no file is written if it's None
+
+    memory: bool (default:False) --> Optional parameter
+        Trace the peak memory of each stage (see Profiler)
+
+    Returns
+    -------
+
+    profiler: Profiler
+        Profiler of the block, its report is available after the block
+    """
+
+    global _active
+
+    previous, _active = _active, Profiler(memory)
+    profiler = _active
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active = previous
+        if path is not None:
+            profiler.write(path)
+
+### Profiler of the whole run when APT_PROFILE is set (the report is written at exit)
+if os.environ.get('APT_PROFILE', '0') not in ('', '0'):
+    _active = Profiler(os.environ.get('APT_PROFILE_MEMORY', '0') not in ('', '0'))
+    _active.start()
+    atexit.register(_active.write, os.environ['APT_PROFILE'] if os.environ['APT_PROFILE'] != '1'
+                    else f'profile_{os.getpid()}.json')
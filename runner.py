@@ -0,0 +1,234 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- runner.py : It's a python script to run the models over several exchanges and days in parallel      -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# Required local scripts
+import functions as fn
+import profiling
+from cache import cached
+from data import OrderBook
+
+# ================================== Analyses definition ================================================== #
+
+### Analyses that can be run (name --> function)
+ANALYSES = {'apt_all': fn.apt_check_all, 'apt_tob': fn.apt_check_tob, 'roll': fn.roll_model_check}
+
+_DAY_NS = 24 * 60 * 60 * 10**9
+
+# ================================ Shared memory orderbooks =============================================== #
+
+### Class definition
+class SharedOrderBook:
+
+    """
+    OrderBook copied once into a shared memory block. The object only keeps the block name and the layout of the
+    arrays, so it's cheap to send to the workers, and each worker maps the same memory instead of receiving a
+    pickled copy of the data
+
+    Parameters
+    ----------
+
+    ob_data: OrderBook (default:None) --> Required parameter
+        Columnar orderbook container to share
+    """
+
+    def __init__(self, ob_data:OrderBook):
+
+        arrays = ob_data.arrays()
+
+        # Layout of the arrays in the block (name, dtype, shape, byte offset)
+        self.layout = []
+        size = 0
+        for name, values in arrays.items():
+            self.layout.append((name, values.dtype.str, values.shape, size))
+            size += -(-values.nbytes // 8) * 8 # 8 bytes alignment
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.name = self._shm.name
+
+        for (name, dtype, shape, offset), values in zip(self.layout, arrays.values()):
+            np.ndarray(shape, dtype, buffer=self._shm.buf, offset=offset)[...] = values
+
+    def __getstate__(self) -> dict:
+        return {'name': self.name, 'layout': self.layout}
+
+    def __setstate__(self, state:dict):
+        self.__dict__.update(state)
+        self._shm = None
+
+    def attach(self) -> OrderBook:
+
+        """ OrderBook over the shared block (no copy of the level arrays) """
+
+        self._shm = self._shm or shared_memory.SharedMemory(name=self.name)
+        arrays = {name: np.ndarray(shape, dtype, buffer=self._shm.buf, offset=offset)
+                  for name, dtype, shape, offset in self.layout}
+
+        return OrderBook(arrays['labels'].tolist(), arrays['timestamps'], arrays['offsets'],
+                         **{column: arrays[column] for column in OrderBook.columns})
+
+    def release(self):
+
+        """ Free the shared block (only from the process that created it) """
+
+        self._shm.close()
+        self._shm.unlink()
+
+### Orderbooks already attached by the current worker (block name --> OrderBook)
+_attached = {}
+
+### Function definition for one task (all the analyses of one exchange and one day)
+def _run_task(shared:SharedOrderBook, start:int, end:int, analyses:list, pt_data:pd.DataFrame,
+              params:dict, cache:bool=False, profile:bool=None) -> tuple:
+
+    # Workers exit without the atexit handlers, so each task is profiled on its own and its report is returned
+    if profile is not None:
+        with profiling.profile(memory=profile) as profiler:
+            r_data = _run_task(shared, start, end, analyses, pt_data, params, cache)[0]
+        return r_data, profiler.report()
+
+    if shared.name not in _attached:
+        _attached[shared.name] = (shared, shared.attach())
+    ob_data = _attached[shared.name][1].between(pd.Timestamp(start), pd.Timestamp(end))
+
+    r_data = {}
+    for name in analyses:
+        args = (ob_data, pt_data) if name == 'roll' else (ob_data,)
+        kwargs = params.get(name, {})
+        r_data[name] = cached(ANALYSES[name], *args, **kwargs) if cache else ANALYSES[name](*args, **kwargs)
+
+    return r_data, None
+
+# ==================================== Parallel runner ==================================================== #
+
+### Function definition
+def run_analyses(ob_data:dict,
+                 pt_data=None,
+                 analyses:list=None,
+                 by_day:bool=True,
+                 max_workers:int=None,
+                 params:dict=None,
+                 cache:bool=False) -> dict:
+
+    """
+    Parallel runner for the model functions. The orderbooks of each exchange are shared with the workers through
+    shared memory, and one task is run for each exchange and trading day (UTC) in a process pool. When a profiler
+    is active (see profiling.py) the reports of the tasks are merged into it
+
+    Parameters
+    ----------
+
+    ob_data: dict (default:None) --> Required parameter
+        Orderbook data of each exchange (exchange --> OrderBook)
+
+    pt_data: DataFrame or dict (default:None) --> Optional parameter
+        Public trades data frame for all the exchanges, or a dict (exchange --> data frame). Required for 'roll'
+
+    analyses: list (default:None) --> Optional parameter
+        Names of the analyses to run ('apt_all', 'apt_tob' and 'roll'), all of them if it's None
+
+    by_day: bool (default:True) --> Optional parameter
+        Split the data of each exchange by trading day, a single task for each exchange if it's False
+
+    max_workers: int (default:None) --> Optional parameter
+        Number of worker processes, the number of processors if it's None
+
+    params: dict (default:None) --> Optional parameter
+        Extra keyword arguments of each analysis (analysis name --> dict of arguments)
+
+    cache: bool (default:False) --> Optional parameter
+        Reuse the results of the previous runs with the same data and parameters (see cache.py)
+
+    Returns
+    -------
+
+    r_data: dict
+        Return data, it's a nested dict with the following structure:
+
+        exchange --> day ('YYYY-MM-DD', or 'all' if by_day is False) --> analysis name --> result of the function
+
+        Days without public trades don't have a 'roll' result
+
+    References
+    ----------
+
+    [1] https://docs.python.org/3/library/multiprocessing.shared_memory.html
+    """
+
+    analyses = list(ANALYSES) if analyses is None else list(analyses)
+    params = params or {}
+
+    if 'roll' in analyses and pt_data is None:
+        raise ValueError("Public trades data (pt_data) is required for the 'roll' analysis")
+
+    profiler = profiling.active()
+    profile = None if profiler is None else profiler.memory
+
+    shared = {}
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for exchange, exchange_data in ob_data.items():
+                shared[exchange] = SharedOrderBook(exchange_data)
+                trades = pt_data.get(exchange) if isinstance(pt_data, dict) else pt_data
+                if 'roll' in analyses:
+                    trade_times, trade_order = _trade_times(trades)
+
+                for day, start, end in _periods(exchange_data.timestamps, by_day):
+                    day_analyses, day_trades = analyses, None
+                    if 'roll' in analyses:
+                        first, last = np.searchsorted(trade_times, [start, end])
+                        day_trades = trades.iloc[np.sort(trade_order[first:last])].reset_index(drop=True)
+                        if len(day_trades) == 0: # The Roll model needs trades, it's skipped on the days without them
+                            day_analyses = [name for name in analyses if name != 'roll']
+                    if not day_analyses:
+                        continue
+
+                    futures[exchange, day] = executor.submit(_run_task, shared[exchange], start, end, day_analyses,
+                                                             day_trades, params, cache, profile)
+
+            # -- Merge the results of all the tasks -- #
+            r_data = {}
+            for (exchange, day), future in futures.items():
+                r_data.setdefault(exchange, {})[day], report = future.result()
+                profiling.merge(report)
+
+    finally:
+        for block in shared.values():
+            block.release()
+
+    return r_data
+
+### Sorted int64 nanoseconds of the public trades (parsed once for all the days) and the order that sorts them
+def _trade_times(trades:pd.DataFrame) -> tuple:
+    times = pd.to_datetime(trades['timestamp']).values.astype('datetime64[ns]').view(np.int64)
+    order = np.argsort(times, kind='stable')
+
+    return times[order], order
+
+### Time periods of the tasks (label, start, end) with int64 nanoseconds bounds
+def _periods(timestamps:np.ndarray, by_day:bool) -> list:
+    if len(timestamps) == 0:
+        return []
+
+    if not by_day:
+        return [('all', int(timestamps.min()), int(timestamps.max()) + 1)]
+
+    days = np.unique(timestamps - timestamps % _DAY_NS)
+
+    return [(str(np.datetime64(int(day), 'ns').astype('datetime64[D]')), int(day), int(day) + _DAY_NS)
+            for day in days]
@@ -0,0 +1,114 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- test_apt.py : It's a python script to check the APT experiments by depth and resolution             -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import pandas as pd
+import numpy as np
+import pytest
+
+# Required local scripts
+import functions as fn
+from data import OrderBook
+
+# ===================================== Depth and resolution tests ======================================== #
+
+### Results of several bucket sizes rolled up from the smallest one, the same as one call for each size
+@pytest.mark.parametrize('orders', ['tob', 'all'])
+def test_apt_check_resolutions(backend, levels, orders):
+    times = pd.Timestamp('2021-07-05 13:00') + pd.to_timedelta(np.arange(len(levels) // 5)*700, unit='ms')
+    ob_data = {time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z': levels.iloc[i*5:(i+1)*5, :4]
+               for i, time in enumerate(times)}
+    freqs = ['1s', '10s', '1min', '5min']
+    apt_check = fn.apt_check_tob if orders == 'tob' else fn.apt_check_all
+
+    result = fn.apt_check_resolutions(ob_data, freqs, orders)
+
+    for freq in freqs:
+        expected = apt_check(ob_data, freq=freq)
+        for key in expected:
+            pd.testing.assert_frame_equal(result[freq][key], expected[key])
+
+### Depth features looked up in the cumulative volumes, the same as the sums over the first levels
+def test_depth_features(backend, levels):
+    ob_data = {str(pd.Timestamp('2021-07-05 13:00') + pd.Timedelta(seconds=i)): levels.iloc[i*5:(i+1)*5, :4]
+               for i in range(len(levels) // 5)}
+    books = list(ob_data.values())
+
+    result = fn.apt_check_depths(ob_data, [1, 3, 5])
+
+    for depth in [1, 3, 5]:
+        bid_size = np.array([book['bid_size'].iloc[:depth].sum() for book in books])
+        ask_size = np.array([book['ask_size'].iloc[:depth].sum() for book in books])
+        bid, ask = np.array([book['bid'].iloc[0] for book in books]), np.array([book['ask'].iloc[0] for book in books])
+
+        features = fn.depth_features(ob_data, depth)
+        w_mid = (bid_size/np.add(bid_size, ask_size))*ask + (ask_size/np.add(bid_size, ask_size))*bid
+        np.testing.assert_allclose(features['imbalance'], bid_size / (bid_size + ask_size))
+        np.testing.assert_array_equal(features['weighted_mid_b'], np.round(w_mid, 2))
+
+        expected = fn.apt_check_tob(ob_data, depth=depth)
+        for key in expected:
+            pd.testing.assert_frame_equal(result[depth][key], expected[key])
+
+### Windowed results of an orderbook that isn't sorted by time, the same as the whole results of the sorted one
+def test_iter_apt_check_all_unsorted(levels):
+    ob_data = OrderBook.from_frames({str(pd.Timestamp('2021-07-05 13:00') + pd.Timedelta(seconds=i)):
+                                     levels.iloc[i*5:(i+1)*5, :4] for i in range(len(levels) // 5)})
+    shuffled = ob_data.take(np.random.default_rng(1).permutation(len(ob_data)))
+
+    expected = fn.apt_check_all(ob_data)
+    windows = list(fn.iter_apt_check_all(shuffled, window='5min'))
+
+    for key in expected:
+        pd.testing.assert_frame_equal(pd.concat([window[key] for window in windows]), expected[key])
+
+### Online counts of orderbooks pushed one at a time, with minutes without orderbooks, the same as the batch ones
+def test_online_apt_check(levels):
+    gaps = np.random.default_rng(4).choice([1, 2, 150], len(levels) // 5, p=[0.6, 0.38, 0.02])
+    times = pd.Timestamp('2021-07-05 13:00') + pd.to_timedelta(np.cumsum(gaps), unit='s')
+    ob_data = OrderBook.from_frames({time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z': levels.iloc[i*5:(i+1)*5, :4]
+                                     for i, time in enumerate(times)})
+
+    online = fn.OnlineAptCheck()
+    for key in ob_data:
+        book = ob_data[key]
+        online.update(key, book['bid_size'], book['bid'], book['ask'], book['ask_size'])
+    result = online.results()
+
+    expected = {'all': fn.apt_check_all(ob_data), 'tob': fn.apt_check_tob(ob_data)}
+    frame = expected['tob']['simple_mid_price']
+    assert ((frame['Exp 1'] + frame['Exp 2']) == 0).any() # empty minutes
+    for orders in expected:
+        for key in expected[orders]:
+            pd.testing.assert_frame_equal(result[orders][key], expected[orders][key])
+
+### Depths of less than one level are a ValueError for both experiments
+@pytest.mark.parametrize('depth', [0, -1])
+def test_invalid_depth(levels, depth):
+    ob_data = OrderBook.from_frames({str(pd.Timestamp('2021-07-05 13:00') + pd.Timedelta(seconds=i)):
+                                     levels.iloc[i*5:(i+1)*5, :4] for i in range(10)})
+
+    for apt_check in [fn.apt_check_all, fn.apt_check_tob]:
+        with pytest.raises(ValueError, match='depth'):
+            apt_check(ob_data, depth=depth)
+
+### Windowed results with other bucket sizes and depths, buckets that cross the windows included
+@pytest.mark.parametrize('freq, depth', [('10s', None), ('5min', 2), ('10min', None), ('1min', 1)])
+def test_iter_apt_check_all_freq(levels, freq, depth):
+    ob_data = OrderBook.from_frames({str(pd.Timestamp('2021-07-05 13:00') + pd.Timedelta(seconds=i)):
+                                     levels.iloc[i*5:(i+1)*5, :4] for i in range(len(levels) // 5)})
+
+    expected = fn.apt_check_all(ob_data, freq=freq, depth=depth)
+    windows = list(fn.iter_apt_check_all(ob_data, window='7min', freq=freq, depth=depth))
+
+    for key in expected:
+        pd.testing.assert_frame_equal(pd.concat([window[key] for window in windows]), expected[key])
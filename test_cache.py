@@ -0,0 +1,86 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- test_cache.py : It's a python script to check the results cache of the model functions              -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import pandas as pd
+import numpy as np
+import pytest
+import sys
+
+# Required local scripts
+import cache
+import functions as fn
+from cache import ResultCache
+from data import OrderBook
+
+# ======================================== Test fixtures ================================================== #
+
+### Small orderbook data (one orderbook each second, 3 levels)
+def _orderbook(shift:float=0.0) -> OrderBook:
+    rng = np.random.default_rng(3)
+    size = 600
+    return OrderBook.from_frames({str(pd.Timestamp('2021-07-05 13:00') + pd.Timedelta(seconds=i)):
+                                  pd.DataFrame({'bid_size': rng.choice([0.5, 1.0], 3),
+                                                'bid': 34000 - np.arange(1, 4) + shift,
+                                                'ask': 34000 + np.arange(1, 4) + rng.integers(0, 2),
+                                                'ask_size': rng.choice([0.5, 1.0], 3)})
+                                  for i in range(size)})
+
+@pytest.fixture
+def results(tmp_path) -> ResultCache:
+    return ResultCache(str(tmp_path), maxsize=2)
+
+# ========================================== Cache tests ================================================== #
+
+### The second call is a hit, on memory and on disk (a new cache over the same folder)
+def test_hit(results, tmp_path):
+    ob_data = _orderbook()
+    first = results.call(fn.apt_check_tob, ob_data)
+
+    assert results.call(fn.apt_check_tob, ob_data) is first
+    assert len(list(tmp_path.glob('*.pkl'))) == 1
+
+    reloaded = ResultCache(str(tmp_path)).call(fn.apt_check_tob, _orderbook())
+    pd.testing.assert_frame_equal(reloaded['simple_mid_price'], first['simple_mid_price'])
+
+### Different data or parameters are different results
+def test_miss(results, tmp_path):
+    ob_data = _orderbook()
+    results.call(fn.apt_check_tob, ob_data)
+    results.call(fn.apt_check_tob, _orderbook(shift=0.5))
+    pt_data = pd.DataFrame({'timestamp': ['2021-07-05 13:00:00.5'] * 50, 'price': 34000.0, 'amount': 1.0,
+                            'side': ['sell', 'buy'] * 25})
+    results.call(fn.roll_model_check, ob_data, pt_data, sample=10)
+    results.call(fn.roll_model_check, ob_data, pt_data, sample=20)
+
+    assert len(list(tmp_path.glob('*.pkl'))) == 4
+
+### Least recently used results are evicted from memory
+def test_eviction(results):
+    books = [_orderbook(shift) for shift in [0.0, 0.5, 1.0]]
+    first = results.call(fn.apt_check_tob, books[0])
+    results.call(fn.apt_check_tob, books[1])
+    results.call(fn.apt_check_tob, books[2])
+
+    assert results.call(fn.apt_check_tob, books[0]) is not first
+
+### A change in the source code of the modules behind the model functions is a miss
+def test_code_change(results, tmp_path, monkeypatch):
+    ob_data = _orderbook()
+    key = results.key(fn.apt_check_tob, ob_data)
+
+    changed = tmp_path / 'kernels.py'
+    changed.write_text(open(sys.modules['kernels'].__file__).read() + '\n# changed\n')
+    monkeypatch.setattr(sys.modules['kernels'], '__file__', str(changed))
+    monkeypatch.setattr(cache, '_code_hashes', {})
+
+    assert results.key(fn.apt_check_tob, ob_data) != key
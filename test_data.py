@@ -0,0 +1,121 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- test_data.py : It's a python script to check the orderbook container and the data loaders           -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import pandas as pd
+import numpy as np
+import json
+import pytest
+
+# Required local scripts
+import data as dt
+from data import OrderBook
+
+# ======================================== Test fixtures ================================================== #
+
+### Orderbooks json files in a temporary folder, with the binary cache in the same folder
+@pytest.fixture
+def write_orderbooks(tmp_path, monkeypatch):
+    monkeypatch.setattr(dt, 'CACHE_DIR', str(tmp_path / 'cache'))
+
+    def write(folder:str, bid:float) -> str:
+        (tmp_path / folder).mkdir(exist_ok=True)
+        path = tmp_path / folder / 'orderbooks.json'
+        path.write_text(json.dumps({'bitfinex': {'2021-07-05T13:00:00.000Z': {'bid_size': [1.0], 'bid': [bid],
+                                                                              'ask': [bid + 1], 'ask_size': [2.0]},
+                                                 '2021-07-05T13:00:01.000Z': None},
+                                    'kraken': {'2021-07-05T13:00:00.000Z': None}}))
+        return str(path)
+
+    return write
+
+# ======================================= Container tests ================================================= #
+
+### Missing volumes below the first level don't misalign the columns
+def test_from_snapshots_missing_values():
+    snapshots = [('2021-07-05T13:00:00.000Z', [{'bid_size': 1, 'bid': 10, 'ask': 11, 'ask_size': 2},
+                                                {'bid_size': 3, 'bid': 9, 'ask': 12, 'ask_size': None}]),
+                 ('2021-07-05T13:00:01.000Z', [{'bid_size': 5, 'bid': 8, 'ask': 13, 'ask_size': 6}])]
+
+    ob_data = OrderBook.from_snapshots(snapshots)
+
+    np.testing.assert_array_equal(ob_data.offsets, [0, 2, 3])
+    np.testing.assert_array_equal(ob_data.bid, [10, 9, 8])
+    np.testing.assert_array_equal(ob_data.ask_size, [2, np.nan, 6])
+    assert all(len(getattr(ob_data, column)) == 3 for column in OrderBook.columns)
+
+# ========================================== Cache tests ================================================== #
+
+### Missing exchanges and exchanges with only None orderbooks are empty, with and without the cache
+@pytest.mark.parametrize('exchange', ['kraken', 'binance'])
+def test_cache_empty_exchange(write_orderbooks, exchange):
+    path = write_orderbooks('a', 34000.0)
+
+    for cache in [False, True, True]:
+        ob_data = dt.load_orderbooks.__wrapped__(exchange, path=path, cache=cache)
+        assert len(ob_data) == 0 and len(ob_data.bid) == 0
+
+### Source files with the same name in different folders don't share their cache
+def test_cache_same_name(write_orderbooks, tmp_path):
+    first, second = write_orderbooks('a', 34000.0), write_orderbooks('b', 35000.0)
+
+    assert dt.load_orderbooks.__wrapped__('bitfinex', path=first).bid[0] == 34000.0
+    assert dt.load_orderbooks.__wrapped__('bitfinex', path=second).bid[0] == 35000.0
+    assert dt.load_orderbooks.__wrapped__('bitfinex', path=first).bid[0] == 34000.0
+    assert len(list((tmp_path / 'cache').iterdir())) == 2
+
+### A rebuilt cache doesn't change the arrays already memory-mapped from the previous one
+def test_cache_rebuild(write_orderbooks):
+    path = write_orderbooks('a', 34000.0)
+    ob_data = dt.load_orderbooks.__wrapped__('bitfinex', path=path)
+
+    write_orderbooks('a', 35000.0)
+    dt.convert_sources(path, None, ['bitfinex'])
+
+    assert ob_data.bid[0] == 34000.0
+    assert dt.load_orderbooks.__wrapped__('bitfinex', path=path).bid[0] == 35000.0
+
+### Public trades csv file in a temporary folder, with the binary cache in the same folder
+@pytest.fixture
+def trades_path(tmp_path, monkeypatch) -> str:
+    monkeypatch.setattr(dt, 'CACHE_DIR', str(tmp_path / 'cache'))
+    path = tmp_path / 'trades.csv'
+    path.write_text('timestamp,price,amount,side\n2021-07-05 13:00:00.100,34000.0,1.0,sell\n'
+                    '2021-07-05 13:00:00.200,34001.0,0.5,buy\n2021-07-05 13:00:01.300,34002.0,0.2,sell\n')
+
+    return str(path)
+
+### Each call of the trades loader returns its own data frame, changes don't reach the next callers
+@pytest.mark.parametrize('cache', [False, True])
+def test_public_trades_copy(trades_path, cache):
+    first = dt.load_public_trades(path=trades_path, cache=cache)
+    first['spread'] = 1.0
+    try:
+        first.loc[0, 'price'] = 0.0
+    except ValueError: # Read only values (pandas without copy on write)
+        pass
+
+    second = dt.load_public_trades(path=trades_path, cache=cache)
+    assert second['price'].tolist() == [34000.0, 34001.0, 34002.0] and 'spread' not in second
+
+### The same data frame with and without the cache, and the cached one over the memory mapped arrays
+def test_public_trades_schema(trades_path):
+    for start, end in [(None, None), ('2021-07-05 13:00:00.150', '2021-07-05 13:00:01')]:
+        cached = dt.load_public_trades(start, end, path=trades_path)
+        pd.testing.assert_frame_equal(cached, dt.load_public_trades(start, end, path=trades_path, cache=False))
+
+    assert str(cached['timestamp'].dtype) == 'datetime64[ns]' and cached['side'].dtype == 'category'
+    for column in ['timestamp', 'price', 'amount']:
+        values = cached[column].values
+        while not isinstance(values, np.memmap) and values.base is not None:
+            values = values.base
+        assert isinstance(values, np.memmap)
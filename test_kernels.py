@@ -0,0 +1,110 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- test_kernels.py : It's a python script to check the kernels backends against the pandas calculation -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import pandas as pd
+import numpy as np
+import pytest
+from statsmodels.tsa.stattools import acf, acovf
+
+# Required local scripts
+import functions as fn
+
+# ========================================= Parity tests ================================================== #
+
+### Weighted mid-price of each level
+def test_weighted_mid(backend, levels):
+    w_mid = lambda b,bv,a,av,d: (bv[:d]/np.add(bv[:d],av[:d]))*a[:d] + (av[:d]/np.add(bv[:d],av[:d]))*b[:d]
+    expected = round(w_mid(levels['bid'], levels['bid_size'], levels['ask'], levels['ask_size'], len(levels)), 2)
+
+    result = fn._kernels['weighted_mid'](levels['bid'].values, levels['bid_size'].values,
+                                         levels['ask'].values, levels['ask_size'].values)
+
+    np.testing.assert_array_equal(np.round(result, 2), expected.values)
+
+### Exp 1 counts, each row against the previous one of the same bucket
+def test_equal_counts(backend, levels):
+    apt_check = lambda df: (df.shift() == df).sum()
+    expected = levels.groupby('bucket')[['bid', 'ask']].apply(apt_check)
+
+    codes = levels['bucket'].values.astype(np.int64)
+    result = fn._kernels['equal_counts'](np.ascontiguousarray(levels[['bid', 'ask']].values), codes, 40)
+
+    np.testing.assert_array_equal(result[expected.index.values], expected.values)
+
+### Expanding and rolling lag 1 autocovariance of the price changes
+def test_lag1_autocovariance(backend, levels):
+    diff_prices = np.diff(((levels['bid'] + levels['ask'])*0.5).values[:600])
+    starts = np.maximum(np.arange(len(diff_prices)) - 50, 0)
+
+    expanding = fn._lag1_autocovariance(diff_prices)
+    rolling = fn._lag1_autocovariance(diff_prices, starts)
+
+    for i in range(1, len(diff_prices)):
+        assert expanding[i] == pytest.approx(acovf(diff_prices[:i+1], adjusted=True, nlag=1)[1], abs=1e-12)
+        assert rolling[i] == pytest.approx(acovf(diff_prices[starts[i]:i+1], adjusted=True, nlag=1)[1], abs=1e-12)
+
+### Rolling theoretical spread with gaps between orderbooks, so some windows hold a single price change
+def test_rolling_spread(backend, levels):
+    gaps = np.random.default_rng(2).choice([1, 1, 3], len(levels) // 5)
+    times = pd.Timestamp('2021-07-05 13:00') + pd.to_timedelta(np.cumsum(gaps), unit='s')
+    ob_data = {time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z': levels.iloc[i*5:(i+1)*5, :4]
+               for i, time in enumerate(times)}
+    pt_data = pd.DataFrame({'timestamp': times[:50].strftime('%Y-%m-%d %H:%M:%S.%f'), 'price': 34000.0,
+                            'amount': 1.0, 'side': ['sell', 'buy'] * 25})
+
+    result = fn.roll_model_check(ob_data, pt_data, windows=['2s'])['spread_definition']['theoretical_spread_2s']
+
+    diff_prices = np.diff([(book['ask'].iloc[0] + book['bid'].iloc[0])*0.5 for book in ob_data.values()])
+    expected = np.zeros(len(ob_data))
+    for i in range(1, len(ob_data)):
+        window = diff_prices[:i][times[1:i+1] > times[i] - pd.Timedelta('2s')]
+        if len(window) > 1:
+            expected[i] = np.sqrt(np.abs(acovf(window, adjusted=True, nlag=1)[1]))*2
+
+    assert np.any(np.diff(np.searchsorted(times.values[1:], times.values[1:] - np.timedelta64(2, 's'),
+                                          side='right')) == 1) # windows with a single change
+    np.testing.assert_allclose(result.values, expected, atol=1e-6) # sqrt of the rounding residuals
+
+    with pytest.raises(ValueError):
+        fn.roll_model_check(ob_data, pt_data.iloc[::-1], windows=['2s'])
+
+### Expanding and rolling lag 1 autocorrelation of the trade directions, with short and constant windows
+def test_lag1_autocorrelation(backend):
+    direction = np.array([-1.0]*6 + [1.0, -1.0, -1.0, 1.0, 1.0, 1.0, 1.0, -1.0]*20 + [1.0]*8)
+    starts = np.maximum(np.arange(len(direction)) - 5, 0)
+
+    expanding = fn._lag1_autocorrelation(direction)
+    rolling = fn._lag1_autocorrelation(direction, starts)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(1, len(direction)):
+            assert expanding[i] == pytest.approx(acf(direction[:i+1], nlags=1)[1], abs=1e-12, nan_ok=True)
+            assert rolling[i] == pytest.approx(acf(direction[starts[i]:i+1], nlags=1)[1], abs=1e-12, nan_ok=True)
+
+    assert np.all(np.isnan(expanding[:6])) and np.all(np.isnan(rolling[-3:]))
+
+### Whole APT results, the same for every backend
+def test_apt_check_tob(backend, levels):
+    ob_data = {str(pd.Timestamp('2021-07-05 13:00') + pd.Timedelta(seconds=i)): levels.iloc[i*5:(i+1)*5, :4]
+               for i in range(len(levels) // 5)}
+
+    price_df = pd.DataFrame({'Simple Mid-Price': [(book['ask'].iloc[0] + book['bid'].iloc[0])*0.5
+                                                  for book in ob_data.values()]},
+                            index=pd.to_datetime(list(ob_data)))
+    grouped = price_df.groupby(pd.Grouper(freq='1min'))
+    expected = grouped.apply(lambda df: sum(df['Simple Mid-Price'].shift() == df['Simple Mid-Price']))
+
+    result = fn.apt_check_tob(ob_data)['simple_mid_price']
+
+    np.testing.assert_array_equal(result['Exp 1'].values, expected.values)
+    np.testing.assert_array_equal(result['Exp 2'].values, grouped.count()['Simple Mid-Price'].values - expected.values)
@@ -0,0 +1,76 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- test_roll.py : It's a python script to check the Roll model functions                               -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import pandas as pd
+import numpy as np
+import pytest
+
+# Required local scripts
+import functions as fn
+from data import OrderBook
+
+# ======================================== Test fixtures ================================================== #
+
+### One orderbook each second (3 levels) for 20 minutes
+def _orderbook() -> OrderBook:
+    rng = np.random.default_rng(11)
+    times = pd.date_range('2021-07-05 13:00', periods=1200, freq='1s')
+    mid = 34000 + np.repeat(np.cumsum(rng.choice([-0.5, 0, 0, 0.5], len(times))), 3)
+    steps = np.tile([0.5, 1, 1.5], len(times))
+
+    return OrderBook([str(time) for time in times], times.values.astype('datetime64[ns]').view(np.int64),
+                     np.arange(len(times) + 1)*3, bid_size=rng.choice([0.5, 1.0], len(mid)), bid=mid - steps,
+                     ask=mid + steps, ask_size=rng.choice([0.5, 1.0], len(mid)))
+
+### Public trades with the given sides, 100 milliseconds apart
+def _trades(side:np.ndarray) -> pd.DataFrame:
+    times = pd.Timestamp('2021-07-05 13:00') + pd.to_timedelta(np.arange(len(side))*100, unit='ms')
+
+    return pd.DataFrame({'timestamp': times.strftime('%Y-%m-%d %H:%M:%S.%f'), 'price': 34000.0, 'amount': 1.0,
+                         'side': side})
+
+# ======================================= Roll model tests ================================================ #
+
+### Total probabilities rounded as python round does (7971 / 12000 = 0.66425 is 0.6643)
+def test_total_probabilities():
+    side = np.array(['sell'] * 7971 + ['buy'] * 4029)
+    np.random.default_rng(0).shuffle(side)
+
+    result = fn.roll_model_check(_orderbook(), _trades(side), sample=10)
+
+    assert result['total_sell_prob'] == round(7971 / 12000, 4) == 0.6643
+    assert result['total_buy_prob'] == round(4029 / 12000, 4)
+
+### Online state after all the orderbooks and trades, the same as the final values of roll_model_check
+def test_online_roll():
+    ob_data = _orderbook()
+    side = np.array(['sell'] * 7971 + ['buy'] * 4029)
+    np.random.default_rng(0).shuffle(side)
+
+    online = fn.OnlineRoll()
+    for key in ob_data:
+        book = ob_data[key]
+        online.update_book(key, book['bid'].iloc[0], book['ask'].iloc[0])
+    for value in side:
+        state = online.update_trade(value)
+
+    expected = fn.roll_model_check(ob_data, _trades(side), sample=10)
+    spread = expected['spread_definition'].iloc[-1]
+
+    assert state['mid_price'] == spread['mid_price'] and state['real_spread'] == spread['real_spread']
+    assert state['theoretical_spread'] == pytest.approx(spread['theoretical_spread'], abs=1e-9)
+    assert state['theoretical_bid'] == pytest.approx(spread['theoretical_bid'], abs=1e-6) # rounded spread
+    assert state['theoretical_ask'] == pytest.approx(spread['theoretical_ask'], abs=1e-6)
+    assert state['auto_correlation'] == pytest.approx(expected['auto_correlation'], abs=1e-12)
+    assert state['total_sell_prob'] == expected['total_sell_prob'] == 0.6643
+    assert state['total_buy_prob'] == expected['total_buy_prob']
@@ -0,0 +1,78 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- project: Asset Pricing Theory and Roll model empirical definition                                   -- #
+# -- test_runner.py : It's a python script to check the parallel runner against the model functions      -- #
+# -- author: @bmanica                                                                                    -- #
+# -- license: GNU General Public License v3.0                                                            -- #
+# -- repository: https://github.com/bmanica/aptmodel-lab2.git                                            -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# ====================================== Required packages ================================================ #
+
+### Libraries to use
+import pandas as pd
+import numpy as np
+
+# Required local scripts
+import cache
+import functions as fn
+import profiling
+import runner
+from data import OrderBook
+
+# ======================================== Test fixtures ================================================== #
+
+### One orderbook each minute for two days (3 levels), with public trades on the first afternoon only
+def _data() -> tuple:
+    rng = np.random.default_rng(5)
+    times = pd.date_range('2021-07-05', periods=2880, freq='1min')
+    mid = 34000 + np.repeat(np.cumsum(rng.choice([-0.5, 0, 0.5], len(times))), 3)
+    ob_data = OrderBook([str(time) for time in times], times.values.astype('datetime64[ns]').view(np.int64),
+                        np.arange(len(times) + 1)*3,
+                        bid_size=rng.choice([0.5, 1.0], len(mid)), bid=mid - np.tile([0.5, 1, 1.5], len(times)),
+                        ask=mid + np.tile([0.5, 1, 1.5], len(times)), ask_size=rng.choice([0.5, 1.0], len(mid)))
+
+    trade_times = pd.Timestamp('2021-07-05 13:00') + pd.to_timedelta(np.cumsum(rng.integers(0, 3000, 3000)), 'ms')
+    pt_data = pd.DataFrame({'timestamp': trade_times.strftime('%Y-%m-%d %H:%M:%S.%f'),
+                            'price': np.round(34000 + rng.random(3000)*10, 2), 'amount': 1.0,
+                            'side': rng.choice(['sell', 'buy'], 3000)})
+
+    return ob_data, pt_data
+
+# ========================================== Runner tests ================================================= #
+
+### Days without public trades have the APT results but not the Roll model one
+def test_days_without_trades():
+    ob_data, pt_data = _data()
+
+    r_data = runner.run_analyses({'bitfinex': ob_data}, pt_data, ['apt_tob', 'roll'], max_workers=2)
+
+    assert list(r_data['bitfinex']) == ['2021-07-05', '2021-07-06']
+    assert list(r_data['bitfinex']['2021-07-06']) == ['apt_tob']
+
+    first_day = ob_data.between('2021-07-05', '2021-07-06')
+    expected = fn.roll_model_check(first_day, pt_data)
+    result = r_data['bitfinex']['2021-07-05']['roll']
+    assert result['auto_correlation'] == expected['auto_correlation']
+    pd.testing.assert_frame_equal(result['spread_definition'], expected['spread_definition'])
+
+### The results of the tasks are reused from the results cache and the profiles of the workers are merged
+def test_cache_and_profile(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ob_data, pt_data = _data()
+
+    with profiling.profile() as first:
+        expected = runner.run_analyses({'bitfinex': ob_data}, pt_data, ['apt_tob', 'roll'], max_workers=2,
+                                       cache=True)
+    with profiling.profile() as second:
+        r_data = runner.run_analyses({'bitfinex': ob_data}, pt_data, ['apt_tob', 'roll'], max_workers=2,
+                                     cache=True)
+
+    assert len(list((tmp_path / cache.RESULTS_DIR).glob('*.pkl'))) == 3
+    assert first.stages['apt_check_tob']['calls'] == 2 and first.counters['result_cache_misses'] == 3
+    assert 'apt_check_tob' not in second.stages and second.counters['result_cache_hits'] == 3
+    assert sum(worker['tasks'] for worker in second.workers.values()) == 2
+
+    pd.testing.assert_frame_equal(r_data['bitfinex']['2021-07-06']['apt_tob']['simple_mid_price'],
+                                  expected['bitfinex']['2021-07-06']['apt_tob']['simple_mid_price'])
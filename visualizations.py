@@ -15,10 +15,45 @@
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
+from collections.abc import Mapping
+
+# Required local scripts
+import profiling
+
+# ======================================== Downsampling =================================================== #
+
+### Maximum number of points of each line, and number of points from which lines are drawn with WebGL
+MAX_POINTS = 4000
+WEBGL_POINTS = 2000
+
+### Positions of the min and max values of buckets with the same number of points (sorted, with the first and last point)
+def _minmax_indices(y:np.ndarray, max_points:int) -> np.ndarray:
+    size = len(y)
+    n_buckets = max((max_points - 2) // 2, 1)
+    bucket = np.arange(size) * n_buckets // size
+
+    # Sorted by bucket and then by value, the first and last of each bucket are its min and max (nan last)
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket, np.arange(n_buckets))
+    ends = np.append(starts[1:], size) - 1
+
+    return np.unique(np.concatenate([order[starts], order[ends], [0, size - 1]]))
+
+### Line trace of a series, downsampled to max_points and drawn with WebGL when it's still large
+def _line(x, y, max_points:int=None, **kwargs):
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+    if max_points is not None and len(y) > max_points:
+        keep = _minmax_indices(y, max_points)
+        x, y = x[keep], y[keep]
+
+    trace = go.Scattergl if len(y) > WEBGL_POINTS else go.Scatter
+
+    return trace(x=x, y=y, mode='lines', **kwargs)
 
 # ============================== Stacked bar chart for APT model test ===================================== #
 
 ### Function definition
+@profiling.timed('plot_stacked_bar')
 def plot_stacked_bar(exp_df:pd.DataFrame,
                      minutes:int=None):
 
@@ -103,7 +138,9 @@ def plot_stacked_bar(exp_df:pd.DataFrame,
 # ============================= Theoretical spread plot vs real spread ==================================== #
 
 ### Function definition
-def plot_teo_spread(spread_data:pd.DataFrame):
+def plot_teo_spread(spread_data:pd.DataFrame,
+                    figure:str=None,
+                    max_points:int=MAX_POINTS):
 
     """
         Line charts for Roll model testing. It can be for theoretical spread, bid and ask comparison with real
@@ -128,9 +165,22 @@ def plot_teo_spread(spread_data:pd.DataFrame):
             'theoretical_bid': Calculated bid with Roll model definition (Mid-price - Theoretical spread)
             'theoretical_ask': Calculated ask with Roll model definition (Mid-price + Theoretical spread)
 
+        figure: str (default:None) --> Optional parameter
+            Key of a single figure to build ('spread', 'diff', 'bid', 'ask', 'theo' or 'real'), that figure is
+            returned instead of the mapping of all of them
+
+        max_points: int (default:MAX_POINTS) --> Optional parameter
+            Maximum number of points of each line, longer series are reduced to the min and max of buckets with
+            the same number of points (see _minmax_indices), all the points are drawn if it's None
+
         Returns
         -------
 
+        r_data: Mapping
+            Read only dict-like object with the figures below (keys 'spread', 'diff', 'bid', 'ask', 'theo' and
+            'real'). Each figure is built the first time it's accessed and then kept, so only the rendered figures
+            are built
+
         fig_spread: Figure
             Plotly figure containing a line chart where it's compared theoretical vs real spread
 
@@ -156,15 +206,45 @@ def plot_teo_spread(spread_data:pd.DataFrame):
         [1] https://plotly.com/python/line-charts/
         """
 
-    # -- Figure and plot definition for theoretical spreads -- #
+    profiling.count('spread_points', len(spread_data))
+
+    # -- Figures built on first access -- #
+    r_data = _LazyFigures(spread_data, _TEO_SPREAD_FIGURES, max_points=max_points)
+
+    return r_data if figure is None else r_data[figure]
+
+### Class definition for figures built on demand
+class _LazyFigures(Mapping):
+
+    def __init__(self, data:pd.DataFrame, builders:dict, **kwargs):
+        self._data = data
+        self._builders = builders
+        self._kwargs = kwargs
+        self._figures = {}
+
+    def __getitem__(self, key:str) -> go.Figure:
+        if key not in self._figures:
+            builder = self._builders[key]
+            with profiling.stage(f'plot_teo_spread/{key}'):
+                self._figures[key] = builder(self._data, **self._kwargs)
 
+        return self._figures[key]
+
+    def __iter__(self):
+        return iter(self._builders)
+
+    def __len__(self) -> int:
+        return len(self._builders)
+
+### Figure of the theoretical vs real spread
+def _fig_spread(spread_data:pd.DataFrame, max_points:int) -> go.Figure:
     fig_spread = go.Figure(data=[
 
-        go.Scatter(name='Real Spread', x=spread_data.index.values, y=spread_data['real_spread'],
-                   mode='lines', marker={'color': '#B2B641'}),
+        _line(name='Real Spread', x=spread_data.index.values, y=spread_data['real_spread'],
+              marker={'color': '#B2B641'}, max_points=max_points),
 
-        go.Scatter(name='Theoretical Spread', x=spread_data.index.values, y=spread_data['theoretical_spread'],
-                   mode='lines', marker={'color': '#4785C2'})
+        _line(name='Theoretical Spread', x=spread_data.index.values, y=spread_data['theoretical_spread'],
+              marker={'color': '#4785C2'}, max_points=max_points)
     ])
 
     # Plot configuration
@@ -174,11 +254,15 @@ def plot_teo_spread(spread_data:pd.DataFrame):
     fig_spread.update_yaxes(title_text='Spread')
     fig_spread.update_xaxes(title_text='Time')
 
-    # -- Figure and plot definition for theoretical spreads differences -- #
+    return fig_spread
+
+### Figure of the spread differences
+def _fig_diff(spread_data:pd.DataFrame, max_points:int) -> go.Figure:
+    # Only the first 20 orderbooks are drawn (max_points doesn't apply), x is sliced like y
     set_color = lambda x: '#C22911' if x<0 else '#15569B'
     fig_diff = go.Figure(data=[
 
-        go.Bar(name='Diff Spreads', x=spread_data.index.values, y=spread_data['spread_diff'][0:20],
+        go.Bar(name='Diff Spreads', x=spread_data.index.values[0:20], y=spread_data['spread_diff'][0:20],
                marker=dict(color=list(map(set_color, list(spread_data['spread_diff'][0:20])))))
     ])
 
@@ -189,18 +273,20 @@ def plot_teo_spread(spread_data:pd.DataFrame):
     fig_diff.update_yaxes(title_text='Spreads difference')
     fig_diff.update_xaxes(title_text='Time')
 
-    # -- Figure and plot definition for theoretical and real bid -- #
+    return fig_diff
 
+### Figure of the theoretical vs real bid
+def _fig_bid(spread_data:pd.DataFrame, max_points:int) -> go.Figure:
     fig_bid = go.Figure(data=[
 
-        go.Scatter(name='Real Bid', x=spread_data.index.values, y=spread_data['bid'],
-                   mode='lines', marker={'color': '#B2B641'}),
+        _line(name='Real Bid', x=spread_data.index.values, y=spread_data['bid'],
+              marker={'color': '#B2B641'}, max_points=max_points),
 
-        go.Scatter(name='Theoretical Bid', x=spread_data.index.values, y=spread_data['theoretical_bid'],
-                   mode='lines', marker={'color': '#4785C2'}),
+        _line(name='Theoretical Bid', x=spread_data.index.values, y=spread_data['theoretical_bid'],
+              marker={'color': '#4785C2'}, max_points=max_points),
 
-        go.Scatter(name='Mid-Price', x=spread_data.index.values, y=spread_data['mid_price'],
-                   mode='lines', marker={'color': '#000000'})
+        _line(name='Mid-Price', x=spread_data.index.values, y=spread_data['mid_price'],
+              marker={'color': '#000000'}, max_points=max_points)
     ])
 
     # Plot configuration
@@ -210,18 +296,20 @@ def plot_teo_spread(spread_data:pd.DataFrame):
     fig_bid.update_yaxes(title_text='Bid price')
     fig_bid.update_xaxes(title_text='Time')
 
-    # -- Figure and plot definition for theoretical and real ask -- #
+    return fig_bid
 
+### Figure of the theoretical vs real ask
+def _fig_ask(spread_data:pd.DataFrame, max_points:int) -> go.Figure:
     fig_ask = go.Figure(data=[
 
-        go.Scatter(name='Real Ask', x=spread_data.index.values, y=spread_data['ask'],
-                   mode='lines', marker={'color': '#B2B641'}),
+        _line(name='Real Ask', x=spread_data.index.values, y=spread_data['ask'],
+              marker={'color': '#B2B641'}, max_points=max_points),
 
-        go.Scatter(name='Theoretical Ask', x=spread_data.index.values, y=spread_data['theoretical_ask'],
-                   mode='lines', marker={'color': '#4785C2'}),
+        _line(name='Theoretical Ask', x=spread_data.index.values, y=spread_data['theoretical_ask'],
+              marker={'color': '#4785C2'}, max_points=max_points),
 
-        go.Scatter(name='Mid-Price', x=spread_data.index.values, y=spread_data['mid_price'],
-                   mode='lines', marker={'color': '#000000'})
+        _line(name='Mid-Price', x=spread_data.index.values, y=spread_data['mid_price'],
+              marker={'color': '#000000'}, max_points=max_points)
     ])
 
     # Plot configuration
@@ -231,18 +319,20 @@ def plot_teo_spread(spread_data:pd.DataFrame):
     fig_ask.update_yaxes(title_text='Ask price')
     fig_ask.update_xaxes(title_text='Time')
 
-    # -- Figure and plot definition for theoretical metrics -- #
+    return fig_ask
 
+### Figure of the theoretical metrics
+def _fig_theo(spread_data:pd.DataFrame, max_points:int) -> go.Figure:
     fig_theo = go.Figure(data=[
 
-        go.Scatter(name='Theoretical Bid', x=spread_data.index.values, y=spread_data['theoretical_bid'],
-                   mode='lines', marker={'color': '#B2B641'}),
+        _line(name='Theoretical Bid', x=spread_data.index.values, y=spread_data['theoretical_bid'],
+              marker={'color': '#B2B641'}, max_points=max_points),
 
-        go.Scatter(name='Theoretical Ask', x=spread_data.index.values, y=spread_data['theoretical_ask'],
-                   mode='lines', marker={'color': '#4785C2'}),
+        _line(name='Theoretical Ask', x=spread_data.index.values, y=spread_data['theoretical_ask'],
+              marker={'color': '#4785C2'}, max_points=max_points),
 
-        go.Scatter(name='Mid-Price', x=spread_data.index.values, y=spread_data['mid_price'],
-                   mode='lines', marker={'color': '#000000'})
+        _line(name='Mid-Price', x=spread_data.index.values, y=spread_data['mid_price'],
+              marker={'color': '#000000'}, max_points=max_points)
     ])
 
     # Plot configuration
@@ -252,18 +342,20 @@ def plot_teo_spread(spread_data:pd.DataFrame):
     fig_theo.update_yaxes(title_text='Theoretical prices')
     fig_theo.update_xaxes(title_text='Time')
 
-    # -- Figure and plot definition for real metrics -- #
+    return fig_theo
 
+### Figure of the real observed metrics
+def _fig_real(spread_data:pd.DataFrame, max_points:int) -> go.Figure:
     fig_real = go.Figure(data=[
 
-        go.Scatter(name='Real Bid', x=spread_data.index.values, y=spread_data['bid'],
-                   mode='lines', marker={'color': '#B2B641'}),
+        _line(name='Real Bid', x=spread_data.index.values, y=spread_data['bid'],
+              marker={'color': '#B2B641'}, max_points=max_points),
 
-        go.Scatter(name='Real Ask', x=spread_data.index.values, y=spread_data['ask'],
-                   mode='lines', marker={'color': '#4785C2'}),
+        _line(name='Real Ask', x=spread_data.index.values, y=spread_data['ask'],
+              marker={'color': '#4785C2'}, max_points=max_points),
 
-        go.Scatter(name='Mid-Price', x=spread_data.index.values, y=spread_data['mid_price'],
-                   mode='lines', marker={'color': '#000000'})
+        _line(name='Mid-Price', x=spread_data.index.values, y=spread_data['mid_price'],
+              marker={'color': '#000000'}, max_points=max_points)
     ])
 
     # Plot configuration
@@ -273,16 +365,18 @@ def plot_teo_spread(spread_data:pd.DataFrame):
     fig_real.update_yaxes(title_text='Real prices')
     fig_real.update_xaxes(title_text='Time')
 
-    # -- Return data definition -- #
-    r_data = {'spread': fig_spread, 'diff': fig_diff, 'bid': fig_bid, 'ask': fig_ask,
-              'theo': fig_theo, 'real': fig_real}
+    return fig_real
 
-    return r_data
+### Figure builders of plot_teo_spread (key --> builder)
+_TEO_SPREAD_FIGURES = {'spread': _fig_spread, 'diff': _fig_diff, 'bid': _fig_bid, 'ask': _fig_ask,
+                       'theo': _fig_theo, 'real': _fig_real}
 
 # ============================== Probability evolution in orders plot ===================================== #
 
 ### Function definition
-def plot_prob_evo(pt_data:pd.DataFrame):
+@profiling.timed('plot_prob_evo')
+def plot_prob_evo(pt_data:pd.DataFrame,
+                  max_points:int=MAX_POINTS):
 
     """
         Line chart to describe the evolution of probability between orders and their changes. The goal of this
@@ -302,6 +396,9 @@ def plot_prob_evo(pt_data:pd.DataFrame):
             'prob_buy': Probability evolution of buy orders
             'direction': -1 if there is a sell order and 1 for buy order
 
+        max_points: int (default:MAX_POINTS) --> Optional parameter
+            Maximum number of points of each line (see plot_teo_spread), all the points are drawn if it's None
+
         Returns
         -------
 
@@ -317,14 +414,14 @@ def plot_prob_evo(pt_data:pd.DataFrame):
     # -- Figure definition for probability evolution -- #
     fig = go.Figure(data=[
 
-        go.Scatter(name='Sell', x=pt_data['timestamp'], y=pt_data['prob_sell']*100,
-                   mode='lines', marker={'color': '#B68D2F'}),
+        _line(name='Sell', x=pt_data['timestamp'], y=pt_data['prob_sell']*100,
+              marker={'color': '#B68D2F'}, max_points=max_points),
 
-        go.Scatter(name='Buy', x=pt_data['timestamp'], y=pt_data['prob_buy']*100,
-                   mode='lines', marker={'color': '#434BC7'}),
+        _line(name='Buy', x=pt_data['timestamp'], y=pt_data['prob_buy']*100,
+              marker={'color': '#434BC7'}, max_points=max_points),
 
-        go.Scatter(name='Convergence', x=pt_data['timestamp'], y=[50]*len(pt_data),
-                   mode='lines', marker={'color': '#000000'})
+        _line(name='Convergence', x=pt_data['timestamp'], y=np.full(len(pt_data), 50.0),
+              marker={'color': '#000000'}, max_points=max_points)
     ])
 
     # Plot configuration